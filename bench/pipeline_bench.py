@@ -0,0 +1,362 @@
+"""
+Benchmarks do pipeline probe -> collector -> reporting/dashboard.
+
+  - collector: frota sintética de probes (mesmo formato do send_metric) a uma
+    taxa configurável; mede o que chegou ao log e a taxa de perda do collector
+  - reporting: build_stats_fast (leitura em blocos, memória limitada) sobre logs
+    sintéticos (10^5 .. 10^8); load_metrics + build_stats (tudo em memória)
+    só até --legacy-max-records
+  - dashboard: load_recent_metrics e /api/latest em função do tamanho do log
+
+Os resultados vão para um JSON (--output) para comparar entre versões.
+
+    python3 -m bench.pipeline_bench --records 100000 1000000 --rates 1000 5000 20000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from common.logfiles import columns_cache_path, iter_log_lines, recent_log_files
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+METRICS = ["rtt_ms", "throughput_kbps", "app_latency_ms"]
+
+
+# --------- Geração de dados sintéticos ---------
+
+def synthetic_metric(node_id: str, peer_id: str, metric: str,
+                     ts: float, loss: float = 0.02) -> dict:
+    """Mensagem no formato do probe_node.send_metric."""
+    if random.random() < loss:
+        value = None
+    elif metric == "throughput_kbps":
+        value = random.uniform(500.0, 50000.0)
+    else:
+        value = random.expovariate(1.0 / 5.0)
+    return {
+        "nodeId": node_id,
+        "peerId": peer_id,
+        "metric": metric,
+        "value": value,
+        "timestamp": ts,
+    }
+
+
+def generate_log(path: Path, records: int, nodes: int = 4,
+                 span_seconds: float = 3600.0, loss: float = 0.02) -> Path:
+    """
+    Escreve um log sintético com 'records' linhas, com timestamps a acabar
+    'agora' (para o dashboard ter dados dentro da janela recente).
+    """
+    node_ids = [f"N{i}" for i in range(1, nodes + 1)]
+    links = [(a, b) for a in node_ids for b in node_ids if a != b]
+    end = time.time()
+    start = end - span_seconds
+    step = span_seconds / max(records, 1)
+
+    with path.open("w") as f:
+        for i in range(records):
+            node, peer = links[i % len(links)]
+            metric = METRICS[(i // len(links)) % len(METRICS)]
+            ts = start + i * step
+            msg = synthetic_metric(node, peer, metric, ts, loss)
+            msg["recv_timestamp"] = ts + 0.0002
+            f.write(json.dumps(msg) + "\n")
+    return path
+
+
+# --------- Collector ---------
+
+def _free_udp_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _fleet_worker(port: int, node_id: str, rate: float,
+                  duration: float, sent) -> None:
+    """Um probe sintético: envia 'rate' mensagens/s durante 'duration' s."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = ("127.0.0.1", port)
+    tick = 0.01
+    per_tick = rate * tick
+    credit = 0.0
+    count = 0
+
+    start = time.perf_counter()
+    next_tick = start
+    while True:
+        now = time.perf_counter()
+        if now - start >= duration:
+            break
+        credit += per_tick
+        while credit >= 1.0:
+            msg = synthetic_metric(node_id, "BENCH", "rtt_ms", time.time())
+            sock.sendto(json.dumps(msg).encode(), addr)
+            count += 1
+            credit -= 1.0
+        next_tick += tick
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    with sent.get_lock():
+        sent.value += count
+
+
+def bench_collector(rate: float, duration: float = 5.0, fleet: int = 4,
+                    detector: bool = True) -> dict:
+    """
+    Corre o collector num subprocesso (cwd temporário, para não mexer em logs/)
+    e mede quantas das mensagens enviadas pela frota chegam ao metrics.log.
+    Com 'detector' usa o config/slo.yaml do repositório (a configuração por
+    omissão do collector); sem ele a deteção fica desligada.
+    """
+    port = _free_udp_port()
+    slo_cfg = REPO_ROOT / "config" / "slo.yaml" if detector else Path("no-slo.yaml")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+        proc = subprocess.Popen(
+            [sys.executable, "-c",
+             "from collector.collector import run_collector; "
+             f"run_collector('127.0.0.1', {port}, slo_cfg={str(slo_cfg)!r})"],
+            cwd=tmp, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        time.sleep(1.0)
+
+        sent = multiprocessing.Value("i", 0)
+        workers = [
+            multiprocessing.Process(
+                target=_fleet_worker,
+                args=(port, f"B{i}", rate / fleet, duration, sent),
+            )
+            for i in range(fleet)
+        ]
+        t0 = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        send_elapsed = time.perf_counter() - t0
+
+        # dar tempo ao collector para esvaziar o buffer do socket
+        time.sleep(1.0)
+        proc.terminate()
+        proc.wait(timeout=5)
+
+        received = count_metric_records(Path(tmp) / "logs")
+
+    lost = max(sent.value - received, 0)
+    return {
+        "bench": "collector_ingest",
+        "detector": detector,
+        "target_rate": rate,
+        "fleet": fleet,
+        "duration_s": duration,
+        "sent": sent.value,
+        "received": received,
+        "achieved_send_rate": sent.value / send_elapsed if send_elapsed > 0 else 0.0,
+        "ingest_rate": received / send_elapsed if send_elapsed > 0 else 0.0,
+        "drop_pct": (lost / sent.value * 100.0) if sent.value else 0.0,
+    }
+
+
+def count_metric_records(log_dir: Path) -> int:
+    """
+    Registos de métricas no log do collector, incluindo os segmentos já rodados
+    (e comprimidos); ignora eventos do detetor, marcadores e linhas inválidas.
+    """
+    if not log_dir.exists():
+        return 0
+    count = 0
+    for line in iter_log_lines(recent_log_files(log_dir, log_dir / "metrics.log", since=0.0)):
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(msg, dict) and msg.get("metric") and "event" not in msg:
+            count += 1
+    return count
+
+
+# --------- Reporting / dashboard ---------
+
+def bench_build_stats(log_file: Path, records: int) -> dict:
+    """build_stats sobre load_metrics: guarda o log inteiro em memória."""
+    from reporting.reporting import load_metrics, build_stats
+
+    t0 = time.perf_counter()
+    metrics = load_metrics(log_file)
+    t1 = time.perf_counter()
+    build_stats(metrics)
+    t2 = time.perf_counter()
+
+    total = t2 - t0
+    return {
+        "bench": "build_stats",
+        "records": records,
+        "load_s": t1 - t0,
+        "stats_s": t2 - t1,
+        "total_s": total,
+        "s_per_million": total / records * 1e6 if records else 0.0,
+    }
+
+
+def bench_build_stats_fast(log_file: Path, records: int) -> dict:
+    """
+    build_stats_fast: lê o log em blocos, a memória não depende de 'records'.
+    cold = primeira leitura (interpreta as linhas e escreve a pré-passagem
+    colunar); warm = leituras seguintes (só carrega as colunas).
+    """
+    from reporting.fast_stats import build_stats_fast
+
+    columns_cache_path(log_file).unlink(missing_ok=True)
+    t0 = time.perf_counter()
+    build_stats_fast([log_file])
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    build_stats_fast([log_file])
+    warm = time.perf_counter() - t0
+    return {
+        "bench": "build_stats_fast",
+        "records": records,
+        "total_s": cold,
+        "warm_s": warm,
+        "s_per_million": cold / records * 1e6 if records else 0.0,
+        "warm_s_per_million": warm / records * 1e6 if records else 0.0,
+    }
+
+
+def bench_dashboard(log_file: Path, records: int, repeat: int = 3) -> List[dict]:
+    try:
+        from reporting import dashboard
+    except ImportError as e:
+        print(f"[BENCH] Dashboard benchmarks skipped: {e}")
+        return [{"bench": "dashboard", "records": records, "skipped": str(e)}]
+
+    dashboard.LOG_FILE = log_file
+    results = []
+
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        points = dashboard.load_recent_metrics("rtt_ms", window_seconds=20.0)
+        times.append(time.perf_counter() - t0)
+    results.append({
+        "bench": "load_recent_metrics",
+        "records": records,
+        "points": len(points),
+        "best_s": min(times),
+        "mean_s": sum(times) / len(times),
+    })
+
+    client = dashboard.app.test_client()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        resp = client.get("/api/latest?metric=rtt_ms")
+        times.append(time.perf_counter() - t0)
+    results.append({
+        "bench": "api_latest",
+        "records": records,
+        "status": resp.status_code,
+        "best_s": min(times),
+        "mean_s": sum(times) / len(times),
+    })
+    return results
+
+
+def _git_version() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             cwd=REPO_ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, nargs="*", default=[100_000, 1_000_000],
+                        help="Tamanhos de log sintético a testar (ex: 100000 10000000)")
+    parser.add_argument("--rates", type=float, nargs="*", default=[1000, 5000, 20000],
+                        help="Taxas (msg/s) da frota sintética contra o collector")
+    parser.add_argument("--fleet", type=int, default=4,
+                        help="Nº de probes sintéticos (processos)")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="Duração de cada teste ao collector (s)")
+    parser.add_argument("--legacy-max-records", type=int, default=1_000_000,
+                        help="Maior log em que corre também o build_stats em memória")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--workdir", default=None,
+                        help="Onde guardar os logs sintéticos (default: diretório temporário)")
+    parser.add_argument("--output", default="bench/results.json")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = []
+
+    for rate in args.rates:
+        for detector in (True, False):
+            label = "with" if detector else "without"
+            print(f"[BENCH] Collector ingest at {rate:.0f} msg/s ({label} detector)...")
+            r = bench_collector(rate, duration=args.duration, fleet=args.fleet, detector=detector)
+            print(f"[BENCH]   received {r['received']}/{r['sent']} (drop {r['drop_pct']:.2f}%)")
+            results.append(r)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for records in args.records:
+            log_file = workdir / f"synthetic-{records}.log"
+            print(f"[BENCH] Generating {records} records -> {log_file}")
+            generate_log(log_file, records)
+
+            fast = bench_build_stats_fast(log_file, records)
+            print(f"[BENCH]   build_stats_fast: cold {fast['total_s']:.2f}s, warm {fast['warm_s']:.2f}s "
+                  f"({fast['s_per_million']:.2f} / {fast['warm_s_per_million']:.2f}s per million)")
+            results.append(fast)
+
+            if records <= args.legacy_max_records:
+                r = bench_build_stats(log_file, records)
+                print(f"[BENCH]   build_stats: {r['total_s']:.2f}s ({r['s_per_million']:.2f}s per million)")
+                fast["speedup_cold"] = r["total_s"] / fast["total_s"]
+                fast["speedup_warm"] = r["total_s"] / fast["warm_s"]
+                print(f"[BENCH]   speedup vs build_stats: cold {fast['speedup_cold']:.1f}x, "
+                      f"warm {fast['speedup_warm']:.1f}x")
+                results.append(r)
+
+            for r in bench_dashboard(log_file, records):
+                if "best_s" in r:
+                    print(f"[BENCH]   {r['bench']}: {r['best_s'] * 1000:.1f}ms")
+                results.append(r)
+
+    out = {
+        "version": _git_version(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.output).write_text(json.dumps(out, indent=2))
+    print(f"[BENCH] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Tempo de arranque dos CLIs (probe e chaos manager).
+
+Cada comando é lançado N vezes como processo novo e conta o tempo até sair
+(mediana e p90), em dois casos:
+  - cold: sem a cache de config (config/.cache apagada antes de cada execução)
+  - warm: com a cache já escrita (caso normal a partir da 2ª execução)
+
+Com --baseline-ref corre os mesmos comandos numa cópia (git worktree) dessa
+versão, para comparar antes/depois. Para comparar com a versão sem a cache
+de config usa-se o commit "baseline" (b407298): HEAD~1 é só o commit anterior.
+
+    python3 -m bench.startup_bench --repeat 20 --baseline-ref b407298
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .pipeline_bench import REPO_ROOT, _git_version
+
+# (nome, argumentos do python) — só comandos que terminam logo
+COMMANDS = {
+    "manager_list_nodes": ["-m", "chaos_manager.manager", "--list-nodes"],
+    "manager_list": ["-m", "chaos_manager.manager", "--list"],
+    "import_probe_node": ["-c", "import probe.probe_node as p; p.load_nodes_config()"],
+    "import_manager_scenarios": [
+        "-c", "from chaos_manager.manager import ChaosManager; ChaosManager().scenarios",
+    ],
+}
+
+
+def _clear_cache(repo: Path) -> None:
+    shutil.rmtree(repo / "config" / ".cache", ignore_errors=True)
+
+
+def time_command(repo: Path, args: List[str], repeat: int, cold: bool) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        if cold:
+            _clear_cache(repo)
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=repo, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples) * 1000.0,
+        "p90_ms": samples[int(0.9 * (len(samples) - 1))] * 1000.0,
+        "min_ms": samples[0] * 1000.0,
+    }
+
+
+def bench_repo(repo: Path, repeat: int, label: str) -> Dict[str, dict]:
+    results = {}
+    for name, args in COMMANDS.items():
+        results[name] = {
+            "cold": time_command(repo, args, repeat, cold=True),
+            "warm": time_command(repo, args, repeat, cold=False),
+        }
+        print(f"[BENCH] {label:>8} {name:<26} "
+              f"cold {results[name]['cold']['median_ms']:7.1f} ms   "
+              f"warm {results[name]['warm']['median_ms']:7.1f} ms")
+    return results
+
+
+def _baseline_worktree(ref: str) -> Path:
+    path = Path(tempfile.mkdtemp(prefix="startup-baseline-"))
+    subprocess.run(["git", "worktree", "add", "--detach", str(path), ref],
+                   cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=15,
+                        help="Execuções por comando e por caso (cold/warm)")
+    parser.add_argument("--baseline-ref", default=None,
+                        help="Versão (git ref) a comparar, ex: b407298 (commit \"baseline\", antes da cache de config)")
+    parser.add_argument("--output", default="bench/startup_results.json")
+    args = parser.parse_args()
+
+    report = {
+        "version": _git_version(),
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "current": bench_repo(REPO_ROOT, args.repeat, "current"),
+    }
+
+    baseline: Optional[Path] = None
+    if args.baseline_ref:
+        baseline = _baseline_worktree(args.baseline_ref)
+        try:
+            report["baseline_ref"] = args.baseline_ref
+            report["baseline"] = bench_repo(baseline, args.repeat, "baseline")
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", str(baseline)],
+                           cwd=REPO_ROOT, check=False)
+
+        print("\n[BENCH] Speedup (baseline / current, median, warm):")
+        for name in COMMANDS:
+            before = report["baseline"][name]["warm"]["median_ms"]
+            after = report["current"][name]["warm"]["median_ms"]
+            print(f"  {name:<26} {before:7.1f} -> {after:7.1f} ms  ({before / after:.2f}x)")
+
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"[BENCH] Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
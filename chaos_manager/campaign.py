@@ -0,0 +1,278 @@
+import argparse
+import fnmatch
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from common.selfmetrics import REGISTRY, start_metrics_server
+from .manager import ChaosManager
+
+SCENARIO_SECONDS = REGISTRY.histogram(
+    "campaign_scenario_seconds", "Duração total de cada cenário (warm-up + medição + reset)",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+REPORT_SECONDS = REGISTRY.histogram(
+    "campaign_report_seconds", "Tempo a gerar o relatório de um cenário")
+
+
+def select_scenarios(all_names: List[str], patterns: List[str]) -> List[str]:
+    """
+    Expande a lista de nomes/padrões (estilo glob, ex: 'delay_lo_*') para os
+    cenários definidos no scenarios.yaml, mantendo a ordem pedida e sem repetidos.
+    """
+    selected = []
+    for pattern in patterns:
+        matches = [n for n in all_names if fnmatch.fnmatchcase(n, pattern)]
+        if not matches:
+            print(f"[CAMPAIGN] Pattern '{pattern}' não corresponde a nenhum cenário.")
+        for name in matches:
+            if name not in selected:
+                selected.append(name)
+    return selected
+
+
+# o marker é reenviado até o collector confirmar (pode estar a passar por
+# um link com perda/partição ativa): até MARKER_RETRIES x MARKER_ACK_TIMEOUT
+MARKER_ACK_TIMEOUT = 0.2
+MARKER_RETRIES = 25
+
+
+def _wait_marker_ack(sock: socket.socket, seq: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        sock.settimeout(remaining)
+        try:
+            data, _addr = sock.recvfrom(2048)
+        except socket.timeout:
+            return False
+        except OSError:
+            # ex: ICMP port unreachable (collector ainda em baixo)
+            time.sleep(remaining)
+            return False
+        try:
+            ack = json.loads(data)
+        except ValueError:
+            continue
+        if isinstance(ack, dict) and ack.get("type") == "marker_ack" and ack.get("seq") == seq:
+            return True
+
+
+def send_marker(sock: socket.socket,
+                collector_ip: str,
+                collector_port: int,
+                scenario: str,
+                phase: str,
+                retries: int = MARKER_RETRIES,
+                timeout: float = MARKER_ACK_TIMEOUT) -> bool:
+    """
+    Envia ao collector um marker de início/fim de cenário. Enquanto o cenário
+    está ativo, o collector etiqueta as métricas recebidas com 'scenario'.
+    O marker é repetido (mesmo 'seq') até chegar o ack do collector, que
+    ignora as cópias repetidas ou atrasadas. Devolve False se nunca chegou.
+    """
+    msg = {
+        "type": "marker",
+        "scenario": scenario,
+        "phase": phase,
+        "timestamp": time.time(),
+        "seq": time.time_ns(),
+    }
+    data = json.dumps(msg).encode()
+    for attempt in range(1, retries + 1):
+        try:
+            sock.sendto(data, (collector_ip, collector_port))
+        except OSError as e:
+            print(f"[WARN] Failed to send marker: {e}")
+        if _wait_marker_ack(sock, msg["seq"], timeout):
+            print(f"[CAMPAIGN] Marker {phase}: {scenario}"
+                  + (f" (after {attempt} attempts)" if attempt > 1 else ""))
+            return True
+    print(f"[WARN] Marker {phase} for '{scenario}' not acknowledged by the collector "
+          f"after {retries} attempts: samples may be tagged wrongly.")
+    return False
+
+
+def _scenario_report(log_file: Path, scenario: str, since: float):
+    """
+    Lê o log (incluindo segmentos rodados pelo collector desde 'since')
+    e calcula as estatísticas só das métricas deste cenário.
+    """
+    # import tardio: o reporting só é preciso quando há relatórios a gerar
+    from common.logfiles import recent_log_files
+    from reporting.reporting import load_metrics, build_stats
+
+    start = time.perf_counter()
+    files = recent_log_files(log_file.parent, log_file, since)
+    metrics = [
+        m for m in load_metrics(files)
+        if m.get("scenario") == scenario and m.get("type") != "marker"
+    ]
+    stats = build_stats(metrics)
+    REPORT_SECONDS.observe(time.perf_counter() - start)
+    print(f"[CAMPAIGN] Report ready for '{scenario}' ({len(metrics)} samples)")
+    return stats
+
+
+class Campaign:
+    """
+    Corre uma lista de cenários seguidos:
+      warm-up (falhas aplicadas, métricas ainda não contam)
+      -> janela de medição (marker start/end no collector)
+      -> reset + cool-down antes do cenário seguinte.
+
+    O relatório de cada cenário é gerado numa thread à parte, enquanto o
+    cenário seguinte já está a ser preparado.
+    """
+
+    def __init__(self,
+                 manager: ChaosManager,
+                 scenarios: List[str],
+                 duration: float = 30.0,
+                 warmup: float = 5.0,
+                 cooldown: float = 5.0,
+                 collector_ip: str = "127.0.0.1",
+                 collector_port: int = 5000,
+                 log_file: str = "logs/metrics.log",
+                 target_node: Optional[str] = None):
+        self.manager = manager
+        self.scenarios = scenarios
+        self.duration = duration
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self.collector_ip = collector_ip
+        self.collector_port = collector_port
+        self.log_file = Path(log_file)
+        self.target_node = target_node
+
+        self.marker_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.results = {}
+
+    def _start_scenario(self, name: str) -> threading.Thread:
+        # o cenário fica ativo durante warm-up + medição; o reset (reset_after)
+        # é feito pelo próprio ChaosManager no fim
+        hold = self.warmup + self.duration
+        if self.target_node:
+            target = self.manager.run_scenario_remote
+            kwargs = {"name": name, "target_node": self.target_node, "duration": hold}
+        else:
+            target = self.manager.run_scenario_local
+            kwargs = {"name": name, "duration": hold}
+
+        t = threading.Thread(target=target, kwargs=kwargs, daemon=True)
+        t.start()
+        return t
+
+    def run(self) -> dict:
+        print(f"[CAMPAIGN] Running {len(self.scenarios)} scenarios: {self.scenarios}")
+
+        pending = []
+        with ThreadPoolExecutor(max_workers=1) as reports:
+            for i, name in enumerate(self.scenarios, start=1):
+                print(f"[CAMPAIGN] ({i}/{len(self.scenarios)}) Scenario: {name}")
+                scenario_start = time.perf_counter()
+                scenario_wall_start = time.time()
+                t = self._start_scenario(name)
+
+                time.sleep(self.warmup)
+                send_marker(self.marker_sock, self.collector_ip,
+                            self.collector_port, name, "start")
+                time.sleep(self.duration)
+                send_marker(self.marker_sock, self.collector_ip,
+                            self.collector_port, name, "end")
+
+                t.join()
+                SCENARIO_SECONDS.observe(time.perf_counter() - scenario_start)
+
+                # o relatório deste cenário corre em paralelo com o cool-down
+                # e com o arranque do cenário seguinte
+                fut = reports.submit(_scenario_report, self.log_file, name, scenario_wall_start)
+                pending.append((name, fut))
+
+                if i < len(self.scenarios) and self.cooldown > 0:
+                    print(f"[CAMPAIGN] Cool-down {self.cooldown}s...")
+                    time.sleep(self.cooldown)
+
+            for name, fut in pending:
+                self.results[name] = fut.result()
+
+        return self.results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        required=True,
+        help="Nomes ou padrões glob dos cenários (ex: no_chaos 'delay_lo_*' 'loss_lo_*')",
+    )
+    parser.add_argument("--duration", type=float, default=30.0,
+                        help="Janela de medição por cenário (s)")
+    parser.add_argument("--warmup", type=float, default=5.0,
+                        help="Tempo após aplicar as falhas antes de começar a medir (s)")
+    parser.add_argument("--cooldown", type=float, default=5.0,
+                        help="Pausa entre cenários, depois do reset (s)")
+    parser.add_argument("--collector-ip", default="127.0.0.1")
+    parser.add_argument("--collector-port", type=int, default=5000)
+    parser.add_argument("--log-file", default="logs/metrics.log",
+                        help="Log escrito pelo collector (lido para os relatórios)")
+    parser.add_argument("--scenarios-cfg", default="config/scenarios.yaml")
+    parser.add_argument("--nodes-cfg", default="config/nodes.yaml")
+    parser.add_argument("--target-node", default=None,
+                        help="Se definido, aplica os cenários via SSH nesse node (ex: N1, ALL)")
+    parser.add_argument("--output", default=None,
+                        help="Ficheiro JSON opcional com as estatísticas por cenário")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Se definido, expõe métricas internas em :PORT/metrics")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    cm = ChaosManager(
+        scenarios_path=args.scenarios_cfg,
+        nodes_path=args.nodes_cfg,
+    )
+
+    names = select_scenarios(list(cm.scenarios.keys()), args.scenarios)
+    if not names:
+        raise SystemExit("[CAMPAIGN] Nenhum cenário selecionado.")
+
+    campaign = Campaign(
+        manager=cm,
+        scenarios=names,
+        duration=args.duration,
+        warmup=args.warmup,
+        cooldown=args.cooldown,
+        collector_ip=args.collector_ip,
+        collector_port=args.collector_port,
+        log_file=args.log_file,
+        target_node=args.target_node,
+    )
+    results = campaign.run()
+
+    from reporting.reporting import print_comparison
+    print_comparison(results, scenario_order=names)
+
+    if args.output:
+        out = {
+            sc: {
+                metric_name: {
+                    f"{node}->{peer}": s for (node, peer), s in by_link.items()
+                }
+                for metric_name, by_link in stats.items()
+            }
+            for sc, stats in results.items()
+        }
+        Path(args.output).write_text(json.dumps(out, indent=2))
+        print(f"[CAMPAIGN] Stats written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,11 @@
 import os
+import time
+from typing import Dict, Any, Optional
+
+from common.selfmetrics import REGISTRY
+
+RULE_APPLY_SECONDS = REGISTRY.histogram(
+    "chaos_rule_apply_seconds", "Tempo a aplicar uma regra de falha (tc/iptables)")
 
 
 class FaultEngine:
@@ -10,14 +17,54 @@ class FaultEngine:
       - jitter          (tc netem delay + jitter)
       - rate            (tc tbf – throttling)
       - netem (composite: delay + jitter + loss)
-      - partition       (isolar node/serviço via DROP UDP numa porta específica)
+      - partition       (isolar node/serviço via DROP UDP/TCP numa porta e/ou de/para um IP)
+      - link            (delay/jitter/loss/rate só numa ligação src->dst entre nodes)
+
+    As partitions usam uma chain própria (CHAOS_PARTITION) com um nº fixo de regras
+    que consultam ipsets. Adicionar/remover uma partition é um `ipset add/del` e o
+    reset é um `ipset flush` por set, independentemente do nº de portas ou peers.
+    Numa regra, os campos combinam-se com E (ex: port + src_ip = só essa porta
+    vinda desse IP): cada combinação tem o seu ipset de tipo composto.
     """
 
-    def __init__(self):
-        # Para sabermos em que portas aplicámos partition e conseguir limpar depois
-        self.partition_ports = set()
+    PARTITION_CHAIN = "CHAOS_PARTITION"
+
+    # nome do ipset -> (tipo, regra na chain que o consulta)
+    PARTITION_SETS = {
+        # só porta
+        "chaos_udp_ports": ("bitmap:port range 0-65535", "-p udp -m set --match-set chaos_udp_ports dst"),
+        "chaos_tcp_ports": ("bitmap:port range 0-65535", "-p tcp -m set --match-set chaos_tcp_ports dst"),
+        # só IP (origem ou destino)
+        "chaos_src_ips": ("hash:ip", "-m set --match-set chaos_src_ips src"),
+        "chaos_dst_ips": ("hash:ip", "-m set --match-set chaos_dst_ips dst"),
+        # IP + porta (entradas "ip,udp:9000"; o protocolo faz parte da entrada)
+        "chaos_src_ports": ("hash:net,port", "-m set --match-set chaos_src_ports src,dst"),
+        "chaos_dst_ports": ("hash:net,port", "-m set --match-set chaos_dst_ports dst,dst"),
+        # origem + destino, com ou sem porta
+        "chaos_src_dst": ("hash:net,net", "-m set --match-set chaos_src_dst src,dst"),
+        "chaos_src_port_dst": ("hash:ip,port,ip", "-m set --match-set chaos_src_port_dst src,dst,dst"),
+    }
+
+    # classes HTB por ligação começam em 1:10 (hex); 1:1..1:f ficam livres
+    LINK_CLASS_START = 0x10
+
+    def __init__(self, nodes: Optional[Dict[str, Dict[str, Any]]] = None):
+        # a chain/ipsets de partition só são criados na primeira partition
+        self.partition_ready = False
+
+        # nodes.yaml (nodeId -> ip/port), usado para resolver as regras 'link'
+        self.nodes = nodes or {}
+        # iface -> {(src, dst): minor da classe HTB}
+        self.link_classes: Dict[str, Dict[tuple, int]] = {}
+        # interfaces onde mexemos no qdisc de root (limpas no reset_all)
+        self.ifaces = {"lo"}
 
     def apply_rule(self, rule: dict) -> None:
+        start = time.perf_counter()
+        self._dispatch_rule(rule)
+        RULE_APPLY_SECONDS.observe(time.perf_counter() - start, type=rule.get("type"))
+
+    def _dispatch_rule(self, rule: dict) -> None:
         rtype = rule.get("type")
         if rtype == "delay":
             self._apply_delay(rule)
@@ -33,13 +80,22 @@ class FaultEngine:
         elif rtype == "partition":
             # simula network partition (DROP tráfego numa porta)
             self._apply_partition(rule)
+        elif rtype == "link":
+            # impairment só numa ligação (src->dst), sem afetar o resto da iface
+            self._apply_link(rule)
         else:
             print(f"[FAULT] Tipo de regra desconhecido: {rtype} / regra={rule}")
 
+    def _claim_root(self, iface: str) -> None:
+        """Regras que substituem o root qdisc apagam as classes 'link' dessa iface."""
+        self.ifaces.add(iface)
+        self.link_classes.pop(iface, None)
+
     # --------- Handlers específicos ---------
 
     def _apply_delay(self, rule: dict) -> None:
         iface = rule.get("iface", "lo")
+        self._claim_root(iface)
         delay_ms = rule.get("delay_ms", 100)
 
         cmd = f"tc qdisc replace dev {iface} root netem delay {delay_ms}ms"
@@ -49,6 +105,7 @@ class FaultEngine:
 
     def _apply_loss(self, rule: dict) -> None:
         iface = rule.get("iface", "lo")
+        self._claim_root(iface)
         loss_pct = rule.get("loss_pct", 10)  # %
         cmd = f"tc qdisc replace dev {iface} root netem loss {loss_pct}%"
         print(f"[FAULT] Applying loss: {loss_pct}% on {iface}")
@@ -57,6 +114,7 @@ class FaultEngine:
 
     def _apply_jitter(self, rule: dict) -> None:
         iface = rule.get("iface", "lo")
+        self._claim_root(iface)
         delay_ms = rule.get("delay_ms", 50)
         jitter_ms = rule.get("jitter_ms", 20)
         cmd = (
@@ -73,6 +131,7 @@ class FaultEngine:
         Compatível com cenários T5 (rate_lo_5mbit, rate_lo_1mbit, etc.).
         """
         iface = rule.get("iface", "lo")
+        self._claim_root(iface)
         rate = rule.get("rate", "1mbit")      # ex: "1mbit"
         burst = rule.get("burst", "32kbit")   # ex: "32kbit"
         latency_ms = rule.get("latency_ms", 400)
@@ -88,14 +147,10 @@ class FaultEngine:
         print(f"[FAULT] Executing: {cmd}")
         os.system(cmd)
 
-    def _apply_netem(self, rule: dict) -> None:
-        """
-        Regra 'genérica' que combina delay, loss e jitter numa só linha netem.
-        Compatível com T4 (composite_*) e perfis mobile.
-        Campos opcionais: delay_ms, jitter_ms, loss_pct.
-        """
-        iface = rule.get("iface", "lo")
-        parts = ["tc", "qdisc", "replace", "dev", iface, "root", "netem"]
+    @staticmethod
+    def _netem_args(rule: dict) -> list:
+        """Argumentos 'delay ... loss ...' do netem a partir de delay_ms/jitter_ms/loss_pct."""
+        args = []
 
         delay_ms = rule.get("delay_ms")
         jitter_ms = rule.get("jitter_ms")
@@ -103,60 +158,214 @@ class FaultEngine:
 
         if delay_ms is not None:
             if jitter_ms is not None:
-                parts.extend(["delay", f"{delay_ms}ms", f"{jitter_ms}ms"])
+                args.extend(["delay", f"{delay_ms}ms", f"{jitter_ms}ms"])
             else:
-                parts.extend(["delay", f"{delay_ms}ms"])
+                args.extend(["delay", f"{delay_ms}ms"])
 
         if loss_pct is not None:
-            parts.extend(["loss", f"{loss_pct}%"])
+            args.extend(["loss", f"{loss_pct}%"])
+
+        return args
+
+    def _apply_netem(self, rule: dict) -> None:
+        """
+        Regra 'genérica' que combina delay, loss e jitter numa só linha netem.
+        Compatível com T4 (composite_*) e perfis mobile.
+        Campos opcionais: delay_ms, jitter_ms, loss_pct.
+        """
+        iface = rule.get("iface", "lo")
+        self._claim_root(iface)
+        parts = ["tc", "qdisc", "replace", "dev", iface, "root", "netem"]
+        parts.extend(self._netem_args(rule))
 
         cmd = " ".join(parts)
         print(f"[FAULT] Applying netem composite on {iface}: {cmd}")
         os.system(cmd)
 
-    def _apply_partition(self, rule: dict) -> None:
+    def _node_addr(self, node_id: str):
+        info = self.nodes.get(node_id)
+        if info is None:
+            return None, None
+        return info.get("ip") or info.get("host"), info.get("port")
+
+    def _apply_link(self, rule: dict) -> None:
+        """
+        Impairment por ligação numa interface partilhada:
+          root htb 1:  ->  classe 1:<n> por ligação (rate opcional)
+                       ->  netem próprio em cada classe
+                       ->  filtro u32 (ip src/dst dos nodes) que encaminha para a classe
+        O tráfego que não bate em nenhum filtro passa pela htb sem ser limitado.
+        Campos: src, dst (nodeIds do nodes.yaml), delay_ms, jitter_ms, loss_pct, rate.
+
+        Se src e dst tiverem o mesmo IP (ex: tudo em 127.0.0.1), o filtro usa
+        também a porta do dst, mas assim só apanha os pacotes enviados para o
+        echo do dst (vindos de qualquer node) e não as respostas: não é uma
+        ligação src->dst. Para isso, usar IPs distintos (testbed ou 127.0.0.2, ...).
+
+        Na primeira regra 'link' de uma interface o root qdisc é apagado e
+        recriado: as classes e filtros deixados por uma execução anterior (o
+        estado em link_classes só existe neste processo) não ficam a apanhar
+        tráfego com classids que agora pertencem a outras ligações.
+        """
+        iface = rule.get("iface", "lo")
+        src = rule.get("src")
+        dst = rule.get("dst")
+
+        src_ip, _src_port = self._node_addr(src)
+        dst_ip, dst_port = self._node_addr(dst)
+        if not src_ip or not dst_ip:
+            print(f"[FAULT] link rule com nodes desconhecidos: {src}->{dst}")
+            return
+
+        if src_ip == dst_ip:
+            print(f"[WARN] link {src}->{dst}: mesmo IP ({src_ip}), o filtro só distingue "
+                  f"pela porta de destino {dst_port} (não é uma ligação src->dst)")
+
+        classes = self.link_classes.get(iface)
+        if classes is None:
+            self.ifaces.add(iface)
+            for cmd in (f"tc qdisc del dev {iface} root 2>/dev/null",
+                        f"tc qdisc add dev {iface} root handle 1: htb"):
+                print(f"[FAULT] Executing: {cmd}")
+                os.system(cmd)
+            classes = self.link_classes[iface] = {}
+
+        key = (src, dst)
+        is_new = key not in classes
+        if is_new:
+            classes[key] = self.LINK_CLASS_START + len(classes)
+        minor = classes[key]
+
+        rate = rule.get("rate", "10gbit")
+        netem = " ".join(self._netem_args(rule))
+        cmds = [
+            f"tc class replace dev {iface} parent 1: classid 1:{minor:x} htb rate {rate}",
+            f"tc qdisc replace dev {iface} parent 1:{minor:x} handle {minor:x}: netem {netem}",
+        ]
+
+        if is_new:
+            match = f"match ip src {src_ip}/32 match ip dst {dst_ip}/32"
+            if src_ip == dst_ip and dst_port is not None:
+                match += f" match ip dport {dst_port} 0xffff"
+            cmds.append(
+                f"tc filter add dev {iface} parent 1: protocol ip prio 1 u32 "
+                f"{match} flowid 1:{minor:x}"
+            )
+
+        print(f"[FAULT] Applying link impairment {src}->{dst} on {iface}: rate={rate} {netem}")
+        for cmd in cmds:
+            print(f"[FAULT] Executing: {cmd}")
+            os.system(cmd)
+
+    def _setup_partition_chain(self) -> None:
         """
-        Simula network partition para um node/serviço, fazendo DROP ao tráfego UDP
-        numa determinada porta (usado em T6: partition_probe_N2, partition_service_9000, etc.).
+        Cria (uma vez) os ipsets e a chain CHAOS_PARTITION, ligada a INPUT e OUTPUT.
+        Os comandos são idempotentes (-exist / -C antes de -I), por isso não há
+        problema se já existirem de uma execução anterior.
+        """
+        if self.partition_ready:
+            return
+
+        chain = self.PARTITION_CHAIN
+        cmds = []
+        for set_name, (set_type, _match) in self.PARTITION_SETS.items():
+            cmds.append(f"ipset create {set_name} {set_type} -exist")
+
+        cmds.append(f"iptables -N {chain} 2>/dev/null")
+        cmds.append(f"iptables -F {chain}")
+        for _set_name, (_set_type, match) in self.PARTITION_SETS.items():
+            cmds.append(f"iptables -A {chain} {match} -j DROP")
+
+        for hook in ("INPUT", "OUTPUT"):
+            cmds.append(
+                f"iptables -C {hook} -j {chain} 2>/dev/null || iptables -I {hook} -j {chain}"
+            )
+
+        for cmd in cmds:
+            print(f"[FAULT] Executing: {cmd}")
+            os.system(cmd)
+
+        self.partition_ready = True
+
+    def _partition_entries(self, rule: dict):
+        """
+        Converte uma regra de partition em entradas (ipset, valor).
+        Campos (todos os que estiverem definidos têm de coincidir):
+          - port      + protocol: "udp" (default), "tcp" ou "both"
+          - src_ip    (tráfego que vem deste IP)
+          - dst_ip    (tráfego que vai para este IP)
+        Para isolar um host nos dois sentidos usam-se duas regras
+        (uma com src_ip, outra com dst_ip).
         """
         port = rule.get("port")
+        src = rule.get("src_ip")
+        dst = rule.get("dst_ip")
+
+        protocols = []
+        if port is not None:
+            protocol = rule.get("protocol", "udp")
+            if protocol not in ("udp", "tcp", "both"):
+                print(f"[FAULT] partition com protocol inválido: {protocol}")
+                return []
+            protocols = ["udp", "tcp"] if protocol == "both" else [protocol]
+
+        entries = []
         if port is None:
-            print("[FAULT] partition rule sem 'port' definido")
-            return
+            if src and dst:
+                entries.append(("chaos_src_dst", f"{src},{dst}"))
+            elif src:
+                entries.append(("chaos_src_ips", src))
+            elif dst:
+                entries.append(("chaos_dst_ips", dst))
+            return entries
+
+        for proto in protocols:
+            if src and dst:
+                entries.append(("chaos_src_port_dst", f"{src},{proto}:{port},{dst}"))
+            elif src:
+                entries.append(("chaos_src_ports", f"{src},{proto}:{port}"))
+            elif dst:
+                entries.append(("chaos_dst_ports", f"{dst},{proto}:{port}"))
+            else:
+                entries.append((f"chaos_{proto}_ports", str(port)))
+        return entries
 
-        self.partition_ports.add(port)
+    def _apply_partition(self, rule: dict) -> None:
+        """
+        Simula network partition para um node/serviço, fazendo DROP ao tráfego
+        de uma porta (UDP, TCP ou ambos) e/ou de/para um IP
+        (usado em T6: partition_probe_N2, partition_service_9000, etc.).
+        """
+        entries = self._partition_entries(rule)
+        if not entries:
+            print("[FAULT] partition rule sem 'port', 'src_ip' ou 'dst_ip' definido")
+            return
 
-        # Aqui assumimos UDP (probes e muitos serviços simples). Se precisares de TCP também,
-        # podemos duplicar regras com -p tcp.
-        cmd_in = f"iptables -A INPUT -p udp --dport {port} -j DROP"
-        cmd_out = f"iptables -A OUTPUT -p udp --dport {port} -j DROP"
+        self._setup_partition_chain()
 
-        print(f"[FAULT] Applying partition: DROP UDP porta {port} (INPUT/OUTPUT)")
-        print(f"[FAULT] Executing: {cmd_in}")
-        os.system(cmd_in)
-        print(f"[FAULT] Executing: {cmd_out}")
-        os.system(cmd_out)
+        for set_name, value in entries:
+            cmd = f"ipset add {set_name} {value} -exist"
+            print(f"[FAULT] Applying partition: {set_name} += {value}")
+            print(f"[FAULT] Executing: {cmd}")
+            os.system(cmd)
 
     # --------- Reset ---------
 
     def reset_all(self) -> None:
         """
-        Remove qdisc de root e reverte regras de partition (iptables).
-        Neste protótipo, tratamos 'lo' e as portas usadas em cenários de partition.
+        Remove qdisc de root e reverte regras de partition (ipsets).
+        Neste protótipo, tratamos 'lo' e os ipsets de partition.
         """
-        # Limpar qdisc na lo (podes acrescentar eth0/wlan0 se fizer sentido)
-        for iface in ["lo"]:
+        # Limpar qdisc na lo e nas interfaces onde aplicámos regras
+        for iface in sorted(self.ifaces):
             cmd = f"tc qdisc del dev {iface} root 2>/dev/null"
             print(f"[FAULT] Reset qdisc on {iface}: {cmd}")
             os.system(cmd)
+        self.link_classes.clear()
 
-        # Limpar regras iptables criadas para partition
-        for port in list(self.partition_ports):
-            cmd_in = f"iptables -D INPUT -p udp --dport {port} -j DROP"
-            cmd_out = f"iptables -D OUTPUT -p udp --dport {port} -j DROP"
-            print(f"[FAULT] Reset partition INPUT porta {port}: {cmd_in}")
-            os.system(cmd_in)
-            print(f"[FAULT] Reset partition OUTPUT porta {port}: {cmd_out}")
-            os.system(cmd_out)
-
-        self.partition_ports.clear()
+        # Limpar partitions: basta esvaziar os ipsets (a chain fica, mas sem efeito).
+        # Faz-se sempre, para limpar também partitions deixadas por outro processo.
+        for set_name in self.PARTITION_SETS:
+            cmd = f"ipset flush {set_name} 2>/dev/null"
+            print(f"[FAULT] Reset partition set: {cmd}")
+            os.system(cmd)
@@ -3,10 +3,7 @@ import argparse
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-import yaml
-
-from .fault_engine import FaultEngine
-from .remote_executor import run_scenario_remote
+from common.config_cache import load_yaml_cached
 
 
 class ChaosManager:
@@ -14,38 +11,65 @@ class ChaosManager:
         self,
         scenarios_path: str = "config/scenarios.yaml",
         nodes_path: str = "config/nodes.yaml",
+        iface: Optional[str] = None,
     ):
+        # Os ficheiros só são lidos quando são precisos (ex: --list-nodes não
+        # lê os cenários) e passam pela cache de config (sem PyYAML se não mudaram).
         # Cenários (o que é que vamos aplicar)
         self.scenarios_path = Path(scenarios_path)
-        with self.scenarios_path.open() as f:
-            data = yaml.safe_load(f) or {}
-        self.scenarios = data.get("scenarios", {})
-        self.engine = FaultEngine()
+        self._scenarios: Optional[Dict[str, Any]] = None
 
         # Nodes (onde é que vamos aplicar)
         self.nodes_path = Path(nodes_path)
-        if self.nodes_path.exists():
-            with self.nodes_path.open() as f:
-                ndata = yaml.safe_load(f) or {}
-            self.nodes: Dict[str, Dict[str, Any]] = ndata.get("nodes", {})
-        else:
-            self.nodes = {}
-
-        print(f"[CHAOS] Loaded {len(self.scenarios)} scenarios from {self.scenarios_path}")
-        print(f"[CHAOS] Loaded {len(self.nodes)} nodes from {self.nodes_path}")
+        self._nodes: Optional[Dict[str, Dict[str, Any]]] = None
+
+        # Se definido, substitui o 'iface' de todas as regras (ex: eth0 dentro
+        # de um network namespace do testbed, em vez de lo)
+        self.iface = iface
+        self._engine = None
+
+    @property
+    def scenarios(self) -> Dict[str, Any]:
+        if self._scenarios is None:
+            data = load_yaml_cached(self.scenarios_path) or {}
+            self._scenarios = data.get("scenarios", {})
+            print(f"[CHAOS] Loaded {len(self._scenarios)} scenarios from {self.scenarios_path}")
+        return self._scenarios
+
+    @property
+    def nodes(self) -> Dict[str, Dict[str, Any]]:
+        if self._nodes is None:
+            if self.nodes_path.exists():
+                ndata = load_yaml_cached(self.nodes_path) or {}
+                self._nodes = ndata.get("nodes", {})
+            else:
+                self._nodes = {}
+            print(f"[CHAOS] Loaded {len(self._nodes)} nodes from {self.nodes_path}")
+        return self._nodes
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from .fault_engine import FaultEngine
+
+            # o engine precisa dos nodes para resolver as regras 'link' (src/dst)
+            self._engine = FaultEngine(nodes=self.nodes)
+        return self._engine
 
     def list_scenarios(self) -> None:
+        scenarios = self.scenarios
         print("[CHAOS] Available scenarios:")
-        for name, sc in self.scenarios.items():
+        for name, sc in scenarios.items():
             desc = sc.get("description", "")
             print(f"  - {name}: {desc}")
 
     def list_nodes(self) -> None:
+        nodes = self.nodes
         print("[CHAOS] Known nodes (for SSH orchestration):")
-        if not self.nodes:
+        if not nodes:
             print("  (none)")
             return
-        for nid, info in self.nodes.items():
+        for nid, info in nodes.items():
             host = info.get("host", "?")
             user = info.get("user", "?")
             print(f"  - {nid}: {user}@{host}")
@@ -64,6 +88,8 @@ class ChaosManager:
 
         # aplicar todas as regras localmente
         for rule in rules:
+            if self.iface:
+                rule = {**rule, "iface": self.iface}
             self.engine.apply_rule(rule)
 
         if duration is not None and duration > 0:
@@ -83,6 +109,8 @@ class ChaosManager:
         duration: Optional[float] = None,
     ) -> None:
         """Orquestra o cenário via SSH num node remoto (N1, N2, N3...)."""
+        from .remote_executor import run_scenario_remote
+
         if name not in self.scenarios:
             raise SystemExit(f"[CHAOS] Scenario '{name}' not found.")
 
@@ -147,11 +175,17 @@ def main():
             "Se não for definido, aplica localmente neste host."
         ),
     )
+    parser.add_argument(
+        "--iface",
+        default=None,
+        help="Força a interface de todas as regras (ex: eth0 num namespace do testbed)",
+    )
     args = parser.parse_args()
 
     cm = ChaosManager(
         scenarios_path=args.scenarios_cfg,
         nodes_path=args.nodes_cfg,
+        iface=args.iface,
     )
 
     if args.list or (not args.scenario and not args.list_nodes):
@@ -0,0 +1,254 @@
+"""
+Testbed local multi-node com Linux network namespaces.
+
+Cada node do nodes.yaml fica no seu namespace (chaos-<nodeId>) com uma interface
+eth0 própria, ligada por um par veth a uma bridge no host (chaosbr0). O host fica
+com o IP .254 da bridge, por isso o collector/dashboard correm no host e não são
+afetados pelas regras tc aplicadas dentro de cada namespace.
+
+    sudo python3 -m chaos_manager.testbed up --generate 20
+    sudo python3 -m chaos_manager.testbed apply --scenario delay_lo_100ms --node N3
+    sudo python3 -m chaos_manager.testbed down
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, List
+
+import yaml
+
+BRIDGE = "chaosbr0"
+SUBNET = "10.200.0"
+HOST_IP = f"{SUBNET}.254"
+NS_IFACE = "eth0"
+TESTBED_NODES_CFG = "config/testbed_nodes.yaml"
+
+
+def ns_name(node_id: str) -> str:
+    return f"chaos-{node_id}"
+
+
+def veth_name(node_id: str) -> str:
+    # nomes de interfaces estão limitados a 15 caracteres
+    return f"vc-{node_id}"[:15]
+
+
+def _run(cmd: str) -> None:
+    print(f"[TESTBED] Executing: {cmd}")
+    os.system(cmd)
+
+
+def build_testbed_nodes(nodes: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Atribui a cada node um IP na subnet da bridge, mantendo as portas."""
+    if len(nodes) > 250:
+        raise SystemExit("[TESTBED] Máximo de 250 nodes por testbed.")
+
+    tb_nodes = {}
+    for i, (nid, info) in enumerate(nodes.items(), start=1):
+        tb_nodes[nid] = {
+            "ip": f"{SUBNET}.{i}",
+            "port": info.get("port", 6000 + i),
+        }
+    return tb_nodes
+
+
+def generate_nodes(count: int, base_port: int = 6001) -> Dict[str, Dict[str, Any]]:
+    return {f"N{i}": {"port": base_port + i - 1} for i in range(1, count + 1)}
+
+
+def load_nodes(path: str) -> Dict[str, Dict[str, Any]]:
+    with Path(path).open() as f:
+        data = yaml.safe_load(f) or {}
+    return data.get("nodes", {})
+
+
+def setup_network(tb_nodes: Dict[str, Dict[str, Any]]) -> None:
+    _run(f"ip link add {BRIDGE} type bridge 2>/dev/null")
+    _run(f"ip addr replace {HOST_IP}/24 dev {BRIDGE}")
+    _run(f"ip link set {BRIDGE} up")
+
+    for nid, info in tb_nodes.items():
+        ns = ns_name(nid)
+        veth = veth_name(nid)
+        _run(f"ip netns add {ns}")
+        _run(f"ip link add {veth} type veth peer name {NS_IFACE} netns {ns}")
+        _run(f"ip link set {veth} master {BRIDGE} up")
+        _run(f"ip netns exec {ns} ip addr add {info['ip']}/24 dev {NS_IFACE}")
+        _run(f"ip netns exec {ns} ip link set {NS_IFACE} up")
+        _run(f"ip netns exec {ns} ip link set lo up")
+
+
+def teardown_network(node_ids: List[str]) -> None:
+    for nid in node_ids:
+        ns = ns_name(nid)
+        # matar o que ainda estiver a correr no namespace antes de o apagar
+        _run(f"ip netns pids {ns} 2>/dev/null | xargs -r kill 2>/dev/null")
+        _run(f"ip netns del {ns} 2>/dev/null")
+    _run(f"ip link del {BRIDGE} 2>/dev/null")
+
+
+def _ns_python(node_id: str, module: str, *args: str) -> List[str]:
+    return ["ip", "netns", "exec", ns_name(node_id), sys.executable, "-m", module, *args]
+
+
+def start_processes(tb_nodes: Dict[str, Dict[str, Any]],
+                    nodes_cfg: str,
+                    collector_port: int,
+                    app_port: int,
+                    throughput: bool,
+                    quiet: bool) -> List[subprocess.Popen]:
+    """
+    Em cada namespace: probe_node (com o seu echo UDP), app_echo_server e,
+    opcionalmente, um throughput_probe para o node seguinte (anel).
+    """
+    out = subprocess.DEVNULL if quiet else None
+    procs = []
+    node_ids = list(tb_nodes.keys())
+
+    for i, nid in enumerate(node_ids):
+        cmds = [
+            _ns_python(nid, "probe.probe_node",
+                       "--node-id", nid,
+                       "--nodes-cfg", nodes_cfg,
+                       "--collector-ip", HOST_IP,
+                       "--collector-port", str(collector_port),
+                       # todos os namespaces partilham o relógio do host
+                       "--clock-offset", "0"),
+            _ns_python(nid, "probe.app_echo_server",
+                       "--host", tb_nodes[nid]["ip"],
+                       "--port", str(app_port)),
+        ]
+        if throughput and len(node_ids) > 1:
+            peer = node_ids[(i + 1) % len(node_ids)]
+            cmds.append(
+                _ns_python(nid, "probe.throughput_probe",
+                           "--node-id", nid,
+                           "--peer-id", peer,
+                           "--nodes-cfg", nodes_cfg,
+                           "--collector-ip", HOST_IP,
+                           "--collector-port", str(collector_port))
+            )
+
+        for cmd in cmds:
+            print(f"[TESTBED] Starting in {ns_name(nid)}: {' '.join(cmd[4:])}")
+            procs.append(subprocess.Popen(cmd, stdout=out, stderr=out))
+
+    return procs
+
+
+def cmd_up(args) -> None:
+    if args.generate:
+        nodes = generate_nodes(args.generate)
+    else:
+        nodes = load_nodes(args.nodes_cfg)
+    if not nodes:
+        raise SystemExit("[TESTBED] Sem nodes para criar.")
+
+    tb_nodes = build_testbed_nodes(nodes)
+
+    # config usada pelos probes dentro dos namespaces e pelo 'apply'
+    Path(args.testbed_cfg).write_text(yaml.safe_dump({"nodes": tb_nodes}, sort_keys=False))
+    print(f"[TESTBED] Wrote {len(tb_nodes)} nodes to {args.testbed_cfg}")
+
+    setup_network(tb_nodes)
+    procs = start_processes(
+        tb_nodes,
+        nodes_cfg=args.testbed_cfg,
+        collector_port=args.collector_port,
+        app_port=args.app_port,
+        throughput=args.throughput,
+        quiet=args.quiet,
+    )
+
+    print(f"[TESTBED] {len(tb_nodes)} nodes up. Collector esperado em 0.0.0.0:{args.collector_port} no host.")
+    print("[TESTBED] Ctrl+C para parar e limpar o testbed.")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n[TESTBED] Stopping...")
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+        for p in procs:
+            try:
+                p.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        teardown_network(list(tb_nodes.keys()))
+
+
+def cmd_down(args) -> None:
+    cfg = Path(args.testbed_cfg)
+    if not cfg.exists():
+        raise SystemExit(f"[TESTBED] {cfg} não existe (nada a limpar?).")
+    teardown_network(list(load_nodes(str(cfg)).keys()))
+
+
+def cmd_apply(args) -> None:
+    """Aplica um cenário dentro do namespace de um node (ou de todos), na eth0 desse node."""
+    tb_nodes = load_nodes(args.testbed_cfg)
+    if args.node == "ALL":
+        targets = list(tb_nodes.keys())
+    elif args.node in tb_nodes:
+        targets = [args.node]
+    else:
+        raise SystemExit(f"[TESTBED] Node '{args.node}' não existe em {args.testbed_cfg}.")
+
+    procs = []
+    for nid in targets:
+        cmd = _ns_python(nid, "chaos_manager.manager",
+                         "--scenario", args.scenario,
+                         "--iface", NS_IFACE,
+                         "--scenarios-cfg", args.scenarios_cfg,
+                         "--nodes-cfg", args.testbed_cfg)
+        if args.duration is not None:
+            cmd.extend(["--duration", str(args.duration)])
+        print(f"[TESTBED] Applying '{args.scenario}' in {ns_name(nid)}")
+        procs.append(subprocess.Popen(cmd))
+
+    for p in procs:
+        p.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--testbed-cfg", default=TESTBED_NODES_CFG,
+                        help="nodes.yaml gerado para o testbed (IPs dos namespaces)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_up = sub.add_parser("up", help="Criar namespaces e arrancar os probes")
+    p_up.add_argument("--nodes-cfg", default="config/nodes.yaml")
+    p_up.add_argument("--generate", type=int, default=0,
+                      help="Gerar N nodes (N1..NN) em vez de ler o nodes.yaml")
+    p_up.add_argument("--collector-port", type=int, default=5000)
+    p_up.add_argument("--app-port", type=int, default=9000)
+    p_up.add_argument("--throughput", action="store_true",
+                      help="Arrancar também um throughput_probe por node (anel)")
+    p_up.add_argument("--quiet", action="store_true",
+                      help="Não mostrar o output dos probes")
+    p_up.set_defaults(func=cmd_up)
+
+    p_down = sub.add_parser("down", help="Parar processos e apagar namespaces/bridge")
+    p_down.set_defaults(func=cmd_down)
+
+    p_apply = sub.add_parser("apply", help="Aplicar um cenário dentro de um namespace")
+    p_apply.add_argument("--scenario", required=True)
+    p_apply.add_argument("--node", required=True, help="nodeId ou ALL")
+    p_apply.add_argument("--duration", type=float, default=None)
+    p_apply.add_argument("--scenarios-cfg", default="config/scenarios.yaml")
+    p_apply.set_defaults(func=cmd_apply)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
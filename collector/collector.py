@@ -1,46 +1,487 @@
+import bisect
 import socket
 import json
 import time
+import argparse
+import fcntl
+import termios
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from common.logfiles import apply_retention, compress_segment, new_segment_path
+from common.selfmetrics import REGISTRY, start_metrics_server
+from .detector import StreamDetector
 
 LOG_DIR = Path("logs")
 LOG_DIR.mkdir(exist_ok=True)
 LOG_FILE = LOG_DIR / "metrics.log"
 
+RECEIVED = REGISTRY.counter(
+    "collector_received_total", "Datagramas recebidos pelo collector")
+PARSE_ERRORS = REGISTRY.counter(
+    "collector_parse_errors_total", "Datagramas com JSON inválido")
+QUEUE_BYTES = REGISTRY.gauge(
+    "collector_socket_queue_bytes", "Bytes à espera no buffer de receção do socket UDP")
+WRITE_SECONDS = REGISTRY.histogram(
+    "collector_write_seconds", "Tempo a escrever (e fazer flush de) uma linha no log")
+
+ROTATIONS = REGISTRY.counter(
+    "collector_log_rotations_total", "Rotações do metrics.log")
+SUMMARIES = REGISTRY.counter(
+    "collector_summaries_total", "Resumos por segundo recebidos de node_collectors")
+NOTICES = REGISTRY.counter(
+    "collector_scenario_notices_total", "Avisos enviados aos probes (type: scenario, budget)")
 
-def _rotate_log_if_exists() -> None:
-    if LOG_FILE.exists():
-        ts = time.strftime("%Y%m%d-%H%M%S")
-        backup = LOG_DIR / f"metrics-{ts}.log"
+
+def _rotate_log_if_exists(log_file: Path = LOG_FILE) -> Optional[Path]:
+    if log_file.exists():
+        backup = new_segment_path(log_file.parent)
         print(f"[COLLECTOR] Rotating old log to {backup.name}")
-        LOG_FILE.rename(backup)
+        log_file.rename(backup)
+        return backup
+    return None
+
+
+class RotatingLog:
+    """
+    metrics.log com rotação durante a execução (por tamanho e/ou idade).
+    Cada segmento fechado é comprimido numa thread à parte (common.logfiles),
+    e depois aplica-se a retenção (nº máximo de segmentos / tamanho total).
+    """
+
+    def __init__(self,
+                 max_bytes: Optional[int] = None,
+                 max_age: Optional[float] = None,
+                 compress: bool = True,
+                 max_segments: Optional[int] = None,
+                 max_total_bytes: Optional[int] = None,
+                 log_file: Path = LOG_FILE):
+        self.log_file = log_file
+        self.log_dir = log_file.parent
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.max_segments = max_segments
+        self.max_total_bytes = max_total_bytes
+
+        # um só worker: comprime os segmentos por ordem, fora do caminho de ingestão
+        self.background = ThreadPoolExecutor(max_workers=1)
+        self.f = self.log_file.open("a")
+        self.opened_at = time.time()
+
+    def write(self, line: str) -> None:
+        self.f.write(line)
+        self.f.flush()
+
+        if ((self.max_bytes and self.f.tell() >= self.max_bytes)
+                or (self.max_age and time.time() - self.opened_at >= self.max_age)):
+            self.rotate()
+
+    def rotate(self) -> None:
+        self.f.close()
+        segment = new_segment_path(self.log_dir)
+        self.log_file.rename(segment)
+        self.f = self.log_file.open("a")
+        self.opened_at = time.time()
+        ROTATIONS.inc()
+        print(f"[COLLECTOR] Rotated log to {segment.name}")
+        self.close_segment(segment)
+
+    def close_segment(self, segment: Path) -> None:
+        self.background.submit(self._finish_segment, segment)
+
+    def _finish_segment(self, segment: Path) -> None:
+        try:
+            if self.compress:
+                gz = compress_segment(segment)
+                print(f"[COLLECTOR] Compressed {segment.name} -> {gz.name}")
+            for old in apply_retention(self.log_dir, self.max_segments, self.max_total_bytes):
+                print(f"[COLLECTOR] Retention: removed {old.name}")
+        except OSError as e:
+            print(f"[WARN] Failed to finish segment {segment}: {e}")
+
+
+# horizonte (s) do mínimo usado para estimar o offset de relógio de cada node
+CLOCK_HORIZON = 3600.0
+
+
+class NodeClockTracker:
+    """
+    Estima, por nodeId, a diferença entre o relógio do collector e o do node a
+    partir de (recv_timestamp - timestamp) das métricas recebidas. O mínimo num
+    horizonte longo corresponde à amostra com menos atraso de rede/fila, e
+    serve para corrigir os timestamps de nodes com relógios desalinhados.
+
+    Como no ClockOffsetEstimator do probe, o horizonte é longo para que um
+    atraso introduzido por um cenário não seja absorvido pela correção. Só há
+    um sentido (node -> collector), por isso o atraso mínimo fica incluído no
+    offset, e sem referência externa não se distingue de desalinhamento.
+    Nodes que partilham o relógio do collector (mesmo host, ou 'fixed_offset'
+    definido) não são corrigidos pela estimativa.
+    """
+
+    def __init__(self, horizon: float = CLOCK_HORIZON, fixed_offset: Optional[float] = None):
+        self.horizon = horizon
+        self.fixed_offset = fixed_offset
+        # nodeId -> deque monotónica de (recv_ts, diff), com diff crescente
+        self.diffs = {}
+
+    def correct(self, node_id: str, timestamp: float, recv_ts: float,
+                same_host: bool = False) -> float:
+        if self.fixed_offset is not None:
+            return timestamp + self.fixed_offset
+        if same_host:
+            return timestamp
+        diffs = self.diffs.get(node_id)
+        if diffs is None:
+            diffs = self.diffs[node_id] = deque()
+        diff = recv_ts - timestamp
+        while diffs and diffs[-1][1] >= diff:
+            diffs.pop()
+        diffs.append((recv_ts, diff))
+        while diffs[0][0] < recv_ts - self.horizon:
+            diffs.popleft()
+        return timestamp + diffs[0][1]
+
+
+# endereços de probes lembrados para os avisos (os menos recentes saem primeiro)
+MAX_PROBE_ADDRS = 4096
+# um probe sem métricas há mais do que isto deixa de contar para o orçamento do node
+PROBE_TTL = 30.0
+
+
+class ProbeRegistry:
+    """
+    Endereços que enviaram métricas recentemente, com o último cenário e
+    orçamento comunicados a cada um. Memória limitada a 'max_addrs' (LRU).
+
+    Os avisos de cenário vão a cada endereço quando manda uma métrica e o
+    cenário que conhece está desatualizado, e a todos os ativos logo que o
+    cenário muda (set_scenario), sem esperar pela próxima métrica.
+
+    Com 'node_budget' (métricas/s por nodeId), os probes de um node dividem
+    esse orçamento: cada um dos vistos nos últimos 'ttl' segundos recebe
+    node_budget / nº de probes, reavaliado quando aparece um probe novo e
+    no máximo uma vez por segundo.
+    """
+
+    def __init__(self,
+                 node_budget: Optional[float] = None,
+                 max_addrs: int = MAX_PROBE_ADDRS,
+                 ttl: float = PROBE_TTL):
+        self.node_budget = node_budget
+        self.max_addrs = max_addrs
+        self.ttl = ttl
+        self.scenario = None
+        # addr -> [nodeId, visto pela última vez, cenário comunicado, orçamento comunicado]
+        self.probes: "OrderedDict[tuple, list]" = OrderedDict()
+        self.by_node: Dict[str, set] = {}
+        self.next_rebalance: Dict[str, float] = {}
+
+    def _forget(self, addr, node_id) -> None:
+        addrs = self.by_node.get(node_id)
+        if addrs is not None:
+            addrs.discard(addr)
+            if not addrs:
+                del self.by_node[node_id]
+                self.next_rebalance.pop(node_id, None)
+
+    def seen(self, addr, node_id: Optional[str], now: float) -> List[Tuple[tuple, dict]]:
+        """Regista uma mensagem de 'addr'; devolve os avisos (endereço, aviso) a enviar."""
+        state = self.probes.get(addr)
+        rebalance = False
+        if state is None:
+            state = self.probes[addr] = [node_id, now, None, None]
+            while len(self.probes) > self.max_addrs:
+                old_addr, old_state = self.probes.popitem(last=False)
+                self._forget(old_addr, old_state[0])
+            rebalance = True
+        else:
+            self.probes.move_to_end(addr)
+            if state[0] != node_id:
+                self._forget(addr, state[0])
+                state[0] = node_id
+                rebalance = True
+            state[1] = now
+        if node_id is not None:
+            self.by_node.setdefault(node_id, set()).add(addr)
+
+        notices = []
+        if state[2] != self.scenario:
+            state[2] = self.scenario
+            notices.append((addr, {"type": "scenario", "scenario": self.scenario}))
 
+        if self.node_budget and node_id is not None:
+            if rebalance or now >= self.next_rebalance.get(node_id, 0.0):
+                self.next_rebalance[node_id] = now + 1.0
+                notices.extend(self._rebalance(node_id, now))
+        return notices
 
-def run_collector(host: str = "0.0.0.0", port: int = 5000) -> None:
+    def _rebalance(self, node_id: str, now: float) -> List[Tuple[tuple, dict]]:
+        active = [a for a in self.by_node.get(node_id, ()) if now - self.probes[a][1] <= self.ttl]
+        if not active:
+            return []
+        share = self.node_budget / len(active)
+        notices = []
+        for a in active:
+            state = self.probes[a]
+            if state[3] != share:
+                state[3] = share
+                notices.append((a, {"type": "budget", "nodeId": node_id, "rate": share}))
+        return notices
+
+    def set_scenario(self, scenario, now: float) -> List[Tuple[tuple, dict]]:
+        """Novo cenário ativo; devolve os avisos para todos os endereços ativos."""
+        self.scenario = scenario
+        notices = []
+        for addr, state in self.probes.items():
+            if now - state[1] <= self.ttl and state[2] != scenario:
+                state[2] = scenario
+                notices.append((addr, {"type": "scenario", "scenario": scenario}))
+        return notices
+
+
+class ScenarioTimeline:
+    """
+    Histórico recente dos markers (instante no relógio do collector, cenário),
+    para saber qual era o cenário ativo num instante passado (ex: o segundo a
+    que se refere um resumo que chega com atraso).
+    """
+
+    def __init__(self, keep: int = 256):
+        self.keep = keep
+        self.times = []
+        self.scenarios = []
+
+    def set(self, ts: float, scenario: Optional[str]) -> None:
+        self.times.append(ts)
+        self.scenarios.append(scenario)
+        if len(self.times) > self.keep:
+            del self.times[0], self.scenarios[0]
+
+    def at(self, ts: float) -> Optional[str]:
+        i = bisect.bisect_right(self.times, ts)
+        return self.scenarios[i - 1] if i > 0 else None
+
+
+def _is_loopback(addr) -> bool:
+    """Emissor no mesmo host que o collector (mesmo relógio)."""
+    return isinstance(addr, tuple) and str(addr[0]).startswith("127.")
+
+
+def _socket_queue_bytes(sock: socket.socket) -> int:
+    buf = fcntl.ioctl(sock.fileno(), termios.FIONREAD, b"\0\0\0\0")
+    return int.from_bytes(buf, "little")
+
+
+def run_collector(host: str = "0.0.0.0",
+                  port: int = 5000,
+                  metrics_port: Optional[int] = None,
+                  slo_cfg: str = "config/slo.yaml",
+                  rotate_bytes: Optional[int] = 256 * 1024 * 1024,
+                  rotate_seconds: Optional[float] = None,
+                  compress: bool = True,
+                  retain_segments: Optional[int] = None,
+                  retain_bytes: Optional[int] = None,
+                  clock_offset: Optional[float] = None,
+                  node_budget: Optional[float] = None) -> None:
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((host, port))
 
-    _rotate_log_if_exists()
+    if metrics_port:
+        # lido a cada scrape, não só quando chegam datagramas
+        QUEUE_BYTES.set_function(lambda: _socket_queue_bytes(sock))
+        start_metrics_server(metrics_port)
+
+    previous = _rotate_log_if_exists()
+    log = RotatingLog(
+        max_bytes=rotate_bytes,
+        max_age=rotate_seconds,
+        compress=compress,
+        max_segments=retain_segments,
+        max_total_bytes=retain_bytes,
+    )
+    if previous is not None:
+        log.close_segment(previous)
 
     print(f"[COLLECTOR] Listening on {host}:{port}")
     print(f"[COLLECTOR] Logging to {LOG_FILE}")
+    if retain_segments or retain_bytes:
+        print(f"[COLLECTOR] Retention enabled: max {retain_segments or '-'} segments, "
+              f"max {retain_bytes or '-'} bytes (oldest segments are deleted)")
+
+    # deteção online de SLOs/anomalias (desligada se não houver config)
+    detector = StreamDetector.from_config(slo_cfg)
+    if detector is not None:
+        print(f"[COLLECTOR] SLO/anomaly detection enabled ({slo_cfg})")
+
+    # cenário ativo (definido pelos markers enviados pelo campaign runner);
+    # as métricas recebidas enquanto está ativo ficam etiquetadas com ele
+    current_scenario = None
+    last_marker_seq = 0
+    # probes conhecidos (para a amostragem adaptativa e o orçamento por node)
+    probes = ProbeRegistry(node_budget=node_budget)
+    timeline = ScenarioTimeline()
+    clocks = NodeClockTracker(fixed_offset=clock_offset)
 
-    with LOG_FILE.open("a") as f:
-        while True:
-            data, addr = sock.recvfrom(4096)
-            ts = time.time()
+    def notify(notices) -> None:
+        for addr, notice in notices:
             try:
-                msg = json.loads(data.decode())
-            except json.JSONDecodeError:
-                print(f"[WARN] Invalid JSON from {addr}: {data!r}")
-                continue
+                sock.sendto(json.dumps(notice).encode(), addr)
+                NOTICES.inc(type=notice["type"])
+            except OSError as e:
+                print(f"[WARN] Failed to notify {addr}: {e}")
 
-            msg["recv_timestamp"] = ts
+    def write_events(events) -> None:
+        for ev in events:
+            print(f"[DETECT] {ev}")
+            log.write(json.dumps(ev) + "\n")
 
-            print(f"[METRIC] from {addr} -> {msg}")
-            f.write(json.dumps(msg) + "\n")
-            f.flush()
+    next_sweep = None
+    if detector is not None:
+        # acordar mesmo sem tráfego, para o varrimento de séries silenciosas
+        sock.settimeout(detector.sweep_interval)
+        next_sweep = time.time() + detector.sweep_interval
+
+    while True:
+        try:
+            # 65535: os lotes de resumos dos node_collectors podem ter até ~64KB
+            data, addr = sock.recvfrom(65535)
+        except socket.timeout:
+            data = None
+        ts = time.time()
+
+        if next_sweep is not None and ts >= next_sweep:
+            next_sweep = ts + detector.sweep_interval
+            write_events(detector.sweep(ts))
+        if data is None:
+            continue
+        RECEIVED.inc()
+
+        try:
+            msg = json.loads(data.decode())
+        except json.JSONDecodeError:
+            PARSE_ERRORS.inc()
+            print(f"[WARN] Invalid JSON from {addr}: {data!r}")
+            continue
+
+        msg["recv_timestamp"] = ts
+
+        if msg.get("type") == "marker":
+            # o campaign runner repete cada marker até ao ack; cópias repetidas
+            # ou atrasadas (seq já visto) só voltam a receber o ack
+            seq = msg.get("seq")
+            if seq is not None:
+                try:
+                    sock.sendto(json.dumps({"type": "marker_ack", "seq": seq}).encode(), addr)
+                except OSError as e:
+                    print(f"[WARN] Failed to ack marker to {addr}: {e}")
+                if isinstance(seq, int) and seq <= last_marker_seq:
+                    continue
+                if isinstance(seq, int):
+                    last_marker_seq = seq
+            if msg.get("phase") == "start":
+                current_scenario = msg.get("scenario")
+            else:
+                current_scenario = None
+            timeline.set(ts, current_scenario)
+            print(f"[COLLECTOR] Scenario marker from {addr}: {msg}")
+            log.write(json.dumps(msg) + "\n")
+            # avisar já todos os probes (e node_collectors) ativos
+            notify(probes.set_scenario(current_scenario, ts))
+            continue
+
+        notify(probes.seen(addr, msg.get("nodeId"), ts))
+
+        if msg.get("type") in ("batch", "events"):
+            # vindos de um node_collector: alinhar o relógio dele ao do collector
+            shift = 0.0
+            batch_ts = msg.get("timestamp")
+            if isinstance(batch_ts, (int, float)):
+                agg_id = f"agg:{msg.get('from')}"
+                shift = clocks.correct(agg_id, batch_ts, ts, _is_loopback(addr)) - batch_ts
+
+        if msg.get("type") == "events":
+            # eventos do detetor do node_collector (que vê as amostras em bruto)
+            events = msg.get("events") or []
+            for ev in events:
+                ev["recv_timestamp"] = ts
+                ev_ts = ev.get("timestamp")
+                if isinstance(ev_ts, (int, float)):
+                    ev["corrected_timestamp"] = ev_ts + shift
+            write_events(events)
+            continue
+
+        if msg.get("type") == "batch":
+            # resumos por segundo de um node_collector: cada um vira uma linha
+            # do log, com o cenário ativo no segundo a que se refere
+            summaries = msg.get("summaries") or []
+            print(f"[BATCH] from {addr} ({msg.get('from')}): {len(summaries)} summaries")
+            with WRITE_SECONDS.time():
+                for summary in summaries:
+                    summary["recv_timestamp"] = ts
+                    summary_ts = summary.get("timestamp")
+                    if isinstance(summary_ts, (int, float)):
+                        summary["corrected_timestamp"] = summary_ts + shift
+                        scenario = timeline.at(summary_ts + shift)
+                    else:
+                        scenario = current_scenario
+                    if scenario is not None:
+                        summary["scenario"] = scenario
+                    log.write(json.dumps(summary) + "\n")
+            SUMMARIES.inc(len(summaries))
+            continue
+
+        if current_scenario is not None:
+            msg["scenario"] = current_scenario
+
+        node_ts = msg.get("timestamp")
+        if isinstance(node_ts, (int, float)) and msg.get("nodeId") is not None:
+            msg["corrected_timestamp"] = clocks.correct(msg["nodeId"], node_ts, ts,
+                                                        _is_loopback(addr))
+
+        print(f"[METRIC] from {addr} -> {msg}")
+        with WRITE_SECONDS.time():
+            log.write(json.dumps(msg) + "\n")
+
+        if detector is not None:
+            write_events(detector.observe(msg, ts))
 
 
 if __name__ == "__main__":
-    run_collector()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Se definido, expõe métricas internas em :PORT/metrics")
+    parser.add_argument("--slo-cfg", default="config/slo.yaml",
+                        help="Regras de SLO/anomalias (se o ficheiro não existir, a deteção fica desligada)")
+    parser.add_argument("--rotate-mb", type=float, default=256,
+                        help="Roda o metrics.log quando passa este tamanho (MB, 0 = nunca)")
+    parser.add_argument("--rotate-seconds", type=float, default=0,
+                        help="Roda o metrics.log ao fim deste tempo (s, 0 = nunca)")
+    parser.add_argument("--no-compress", action="store_true",
+                        help="Não comprimir (gzip) os segmentos fechados")
+    parser.add_argument("--retain-segments", type=int, default=0,
+                        help="Apaga os segmentos fechados mais antigos acima deste nº (default 0 = nunca apagar)")
+    parser.add_argument("--retain-mb", type=float, default=0,
+                        help="Apaga os segmentos fechados mais antigos acima deste total (MB, default 0 = nunca apagar)")
+    parser.add_argument("--clock-offset", type=float, default=None,
+                        help="Offset fixo (ms) no corrected_timestamp de todos os nodes, ex: 0 se partilham "
+                             "o relógio (default: estimado, exceto emissores em loopback)")
+    parser.add_argument("--node-metric-budget", type=float, default=None,
+                        help="Métricas/s por nodeId, divididas pelos probes ativos desse node")
+    args = parser.parse_args()
+
+    run_collector(args.host, args.port,
+                  metrics_port=args.metrics_port,
+                  slo_cfg=args.slo_cfg,
+                  rotate_bytes=int(args.rotate_mb * 1024 * 1024) or None,
+                  rotate_seconds=args.rotate_seconds or None,
+                  compress=not args.no_compress,
+                  retain_segments=args.retain_segments or None,
+                  retain_bytes=int(args.retain_mb * 1024 * 1024) or None,
+                  clock_offset=None if args.clock_offset is None else args.clock_offset / 1000.0,
+                  node_budget=args.node_metric_budget)
@@ -0,0 +1,268 @@
+import math
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from common.config_cache import load_yaml_cached
+from common.selfmetrics import REGISTRY
+
+EVENTS = REGISTRY.counter(
+    "detector_events_total", "Eventos emitidos pelo detetor (slo_breach, slo_recovered, anomaly)")
+SERIES = REGISTRY.gauge(
+    "detector_series", "Nº de séries (metric, nodeId, peerId) acompanhadas pelo detetor")
+
+SeriesKey = Tuple[str, str, str]
+
+
+class SeriesState:
+    """
+    Estado de uma série (metric, nodeId, peerId), com memória constante:
+      - janela circular das últimas 'window' amostras (None = perda)
+      - média/variância EWMA (baseline para anomalias)
+      - regras SLO atualmente em violação
+      - intervalos entre as últimas amostras (ritmo da série, para o varrimento)
+    """
+
+    __slots__ = ("samples", "lost", "mean", "var", "n", "last_eval",
+                 "last_anomaly", "last_seen", "gaps", "next_missed", "breached")
+
+    def __init__(self, window: int, gap_history: int = 8):
+        self.samples = deque(maxlen=window)
+        self.lost = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+        self.last_eval = 0.0
+        self.last_anomaly = 0.0
+        self.last_seen = 0.0
+        self.gaps = deque(maxlen=gap_history)
+        self.next_missed = 0.0
+        self.breached = set()
+
+    def push(self, value: Optional[float]) -> None:
+        if len(self.samples) == self.samples.maxlen and self.samples[0] is None:
+            self.lost -= 1
+        self.samples.append(value)
+        if value is None:
+            self.lost += 1
+
+
+class StreamDetector:
+    """
+    Análise em streaming das métricas que chegam ao collector.
+
+    Regras SLO (config/slo.yaml), avaliadas por série no máximo de
+    'eval_interval' em 'eval_interval' segundos:
+      - {metric: rtt_ms, quantile: 0.99, max: 150}   -> p99 da janela > 150
+      - {metric: rtt_ms, loss_pct_max: 5}            -> perda na janela > 5%
+    Gera 'slo_breach' ao entrar em violação e 'slo_recovered' ao sair.
+
+    Anomalias: valor a mais de k_sigma desvios da baseline EWMA da série
+    ('anomaly'), com um cool-down por série para não inundar o log.
+
+    Séries silenciosas: uma série que deixa de chegar (probe em baixo, node
+    isolado do collector) não passa por observe(). O collector chama sweep()
+    periodicamente; uma série com regras de perda fica silenciosa quando está
+    calada há mais de 'silence_factor' vezes o maior dos seus intervalos
+    recentes (no mínimo 'silence_timeout' segundos), e a partir daí conta
+    uma perda por cada intervalo desses em falta, para que a regra
+    loss_pct_max dispare também nesse caso. Assim um probe adaptativo que
+    alargou o intervalo (ex: 10s) não gera perdas falsas. Séries com menos
+    de duas amostras ainda não têm ritmo e não são varridas.
+    """
+
+    def __init__(self,
+                 slo_rules: List[dict],
+                 window: int = 200,
+                 alpha: float = 0.1,
+                 k_sigma: float = 4.0,
+                 min_samples: int = 30,
+                 min_eval_samples: int = 10,
+                 eval_interval: float = 0.5,
+                 anomaly_cooldown: float = 5.0,
+                 silence_timeout: Optional[float] = 5.0,
+                 silence_factor: float = 3.0,
+                 sweep_interval: float = 1.0):
+        self.rules_by_metric: Dict[str, List[Tuple[int, dict]]] = {}
+        for idx, rule in enumerate(slo_rules):
+            self.rules_by_metric.setdefault(rule["metric"], []).append((idx, rule))
+
+        self.window = window
+        self.alpha = alpha
+        self.k_sigma = k_sigma
+        self.min_samples = min_samples
+        self.min_eval_samples = min_eval_samples
+        self.eval_interval = eval_interval
+        self.anomaly_cooldown = anomaly_cooldown
+        self.silence_timeout = silence_timeout
+        self.silence_factor = silence_factor
+        self.sweep_interval = sweep_interval
+        self.series: Dict[SeriesKey, SeriesState] = {}
+
+    @classmethod
+    def from_config(cls, path: str) -> Optional["StreamDetector"]:
+        cfg_path = Path(path)
+        if not cfg_path.exists():
+            return None
+        data = load_yaml_cached(cfg_path) or {}
+        anomaly = data.get("anomaly", {})
+        return cls(
+            slo_rules=data.get("slo", []),
+            window=data.get("window", 200),
+            min_eval_samples=data.get("min_eval_samples", 10),
+            alpha=anomaly.get("alpha", 0.1),
+            k_sigma=anomaly.get("k_sigma", 4.0),
+            min_samples=anomaly.get("min_samples", 30),
+            eval_interval=data.get("eval_interval", 0.5),
+            anomaly_cooldown=anomaly.get("cooldown", 5.0),
+            silence_timeout=data.get("silence_timeout", 5.0),
+            silence_factor=data.get("silence_factor", 3.0),
+            sweep_interval=data.get("sweep_interval", 1.0),
+        )
+
+    @staticmethod
+    def _describe(rule: dict) -> str:
+        if "quantile" in rule:
+            return f"p{rule['quantile'] * 100:g} > {rule['max']}"
+        return f"loss% > {rule['loss_pct_max']}"
+
+    def _event(self, kind: str, key: SeriesKey, now: float, **fields) -> dict:
+        metric, node, peer = key
+        EVENTS.inc(event=kind)
+        # sem chave 'metric' de topo: assim o reporting/dashboard não confundem
+        # eventos com amostras
+        ev = {
+            "event": kind,
+            "nodeId": node,
+            "peerId": peer,
+            "series_metric": metric,
+            "timestamp": now,
+        }
+        ev.update(fields)
+        return ev
+
+    def _check_anomaly(self, st: SeriesState, key: SeriesKey,
+                       value: float, now: float, events: list) -> None:
+        if st.n >= self.min_samples and st.var > 0.0:
+            std = math.sqrt(st.var)
+            if (abs(value - st.mean) > self.k_sigma * std
+                    and now - st.last_anomaly >= self.anomaly_cooldown):
+                st.last_anomaly = now
+                events.append(self._event(
+                    "anomaly", key, now,
+                    observed=value,
+                    baseline=st.mean,
+                    std=std,
+                ))
+
+        # atualizar baseline EWMA (média e variância)
+        if st.n == 0:
+            st.mean = value
+        else:
+            diff = value - st.mean
+            incr = self.alpha * diff
+            st.mean += incr
+            st.var = (1.0 - self.alpha) * (st.var + diff * incr)
+        st.n += 1
+
+    def _evaluate(self, st: SeriesState, key: SeriesKey,
+                  rules: List[Tuple[int, dict]], now: float, events: list) -> None:
+        total = len(st.samples)
+        if total < self.min_eval_samples:
+            return
+
+        values = None
+        for idx, rule in rules:
+            if "quantile" in rule:
+                if values is None:
+                    values = sorted(v for v in st.samples if v is not None)
+                if not values:
+                    continue
+                pos = min(int(rule["quantile"] * len(values)), len(values) - 1)
+                observed = values[pos]
+                breach = observed > rule["max"]
+                threshold = rule["max"]
+            elif "loss_pct_max" in rule:
+                observed = st.lost / total * 100.0
+                breach = observed > rule["loss_pct_max"]
+                threshold = rule["loss_pct_max"]
+            else:
+                continue
+
+            if breach and idx not in st.breached:
+                st.breached.add(idx)
+                events.append(self._event(
+                    "slo_breach", key, now,
+                    rule=self._describe(rule), observed=observed, threshold=threshold,
+                ))
+            elif not breach and idx in st.breached:
+                st.breached.discard(idx)
+                events.append(self._event(
+                    "slo_recovered", key, now,
+                    rule=self._describe(rule), observed=observed, threshold=threshold,
+                ))
+
+    def observe(self, msg: dict, now: Optional[float] = None) -> List[dict]:
+        """Processa uma métrica; devolve os eventos gerados (normalmente nenhum)."""
+        metric = msg.get("metric")
+        if not metric:
+            return []
+        value = msg.get("value")
+        if value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                # JSON válido mas valor não numérico: ignorar a amostra
+                return []
+        now = time.time() if now is None else now
+
+        key = (metric, msg.get("nodeId"), msg.get("peerId"))
+        st = self.series.get(key)
+        if st is None:
+            st = self.series[key] = SeriesState(self.window)
+            SERIES.set(len(self.series))
+
+        st.push(value)
+        if st.last_seen:
+            st.gaps.append(now - st.last_seen)
+        st.last_seen = now
+        st.next_missed = 0.0
+
+        events = []
+        if value is not None:
+            self._check_anomaly(st, key, value, now, events)
+
+        rules = self.rules_by_metric.get(metric)
+        if rules and now - st.last_eval >= self.eval_interval:
+            st.last_eval = now
+            self._evaluate(st, key, rules, now, events)
+
+        return events
+
+    def sweep(self, now: Optional[float] = None) -> List[dict]:
+        """Conta uma perda em cada série silenciosa e reavalia os SLOs dela."""
+        if not self.silence_timeout:
+            return []
+        now = time.time() if now is None else now
+
+        events = []
+        for key, st in self.series.items():
+            if not st.gaps:
+                continue
+            gap = max(st.gaps)
+            if st.next_missed == 0.0:
+                # primeira perda: 'silence_factor' intervalos sem nada
+                st.next_missed = st.last_seen + max(self.silence_timeout,
+                                                    self.silence_factor * gap)
+            if now < st.next_missed:
+                continue
+            rules = self.rules_by_metric.get(key[0])
+            if not rules or not any("loss_pct_max" in rule for _idx, rule in rules):
+                continue
+            # uma perda por intervalo em falta (não por varrimento)
+            st.next_missed = now + max(gap, self.sweep_interval)
+            st.push(None)
+            st.last_eval = now
+            self._evaluate(st, key, rules, now, events)
+        return events
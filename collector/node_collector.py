@@ -0,0 +1,391 @@
+"""
+Collector local (um por node) para deployments multi-host.
+
+Os probes do node enviam para aqui (UDP em loopback) em vez de mandarem cada
+amostra pela rede para o collector central. O node_collector:
+  - guarda as amostras em bruto localmente (logs/local/metrics.log, com a
+    mesma rotação/compressão do collector) e serve-as a pedido por HTTP
+    (GET /raw?since=..&until=..&metric=..);
+  - agrega por (metric, nodeId, peerId, segundo): count, lost, min, max,
+    média e M2 (common.moments) e um sketch de quantis (common.sketch);
+  - envia os segundos já fechados ao collector central em lotes JSON
+    {"type": "batch", ...} que cabem num datagrama;
+  - corre a deteção de SLOs/anomalias (collector.detector) sobre as amostras
+    em bruto, que o central já não vê, e envia-lhe os eventos
+    ({"type": "events", ...}) para ficarem no log central;
+  - reencaminha aos probes locais os avisos de cenário que o central devolve
+    (amostragem adaptativa) e, com --node-metric-budget, divide o orçamento
+    de métricas/s do node pelos probes locais (collector.ProbeRegistry).
+"""
+
+import argparse
+import json
+import math
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from common.logfiles import iter_log_lines, recent_log_files
+from common.moments import Moments
+from common.selfmetrics import REGISTRY, start_metrics_server
+from common.sketch import LogSketch
+from .collector import ProbeRegistry, RotatingLog, _rotate_log_if_exists
+from .detector import StreamDetector
+
+LOCAL_LOG_FILE = Path("logs/local/metrics.log")
+
+# os segundos só fecham 'LATENESS' segundos depois de acabarem (amostras atrasadas)
+LATENESS = 1.0
+# tamanho máximo de um lote (o central lê datagramas até 65535 bytes)
+MAX_BATCH_BYTES = 60000
+# eventos do detetor por datagrama (cada um tem ~200 bytes)
+MAX_EVENTS_PER_DATAGRAM = 100
+
+LOCAL_RECEIVED = REGISTRY.counter(
+    "node_collector_received_total", "Amostras recebidas dos probes locais")
+SUMMARIES_SENT = REGISTRY.counter(
+    "node_collector_summaries_sent_total", "Resumos por segundo enviados ao collector central")
+BATCH_BYTES = REGISTRY.counter(
+    "node_collector_batch_bytes_total", "Bytes enviados ao collector central")
+EVENTS_SENT = REGISTRY.counter(
+    "node_collector_events_sent_total", "Eventos do detetor enviados ao collector central")
+OPEN_BUCKETS = REGISTRY.gauge(
+    "node_collector_open_buckets", "Segundos (por série) ainda em agregação")
+
+BucketKey = Tuple[str, Optional[str], Optional[str], int]
+
+
+class SecondBucket:
+    __slots__ = ("count", "lost", "min", "max", "moments", "sketch")
+
+    def __init__(self):
+        self.count = 0
+        self.lost = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.moments = Moments()
+        self.sketch = LogSketch()
+
+    def add(self, value: Optional[float]) -> None:
+        self.count += 1
+        if value is None:
+            self.lost += 1
+            return
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.moments.add(value)
+        self.sketch.add(value)
+
+
+class SecondAggregator:
+    """Resumos por segundo de cada série (metric, nodeId, peerId)."""
+
+    def __init__(self, lateness: float = LATENESS):
+        self.lateness = lateness
+        self.buckets: Dict[BucketKey, SecondBucket] = {}
+
+    def add(self, msg: dict, now: float) -> None:
+        metric = msg.get("metric")
+        if not metric:
+            return
+        ts = msg.get("timestamp")
+        if not isinstance(ts, (int, float)):
+            ts = now
+        key = (metric, msg.get("nodeId"), msg.get("peerId"), int(ts))
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = SecondBucket()
+
+        value = msg.get("value")
+        try:
+            bucket.add(None if value is None else float(value))
+        except (TypeError, ValueError):
+            bucket.count += 1
+            bucket.lost += 1
+
+    def pop_closed(self, now: float) -> List[dict]:
+        """Remove e devolve os resumos dos segundos já fechados."""
+        limit = now - self.lateness
+        closed = [k for k in self.buckets if k[3] + 1 <= limit]
+        closed.sort(key=lambda k: k[3])
+        out = []
+        for key in closed:
+            b = self.buckets.pop(key)
+            metric, node, peer, second = key
+            ok = b.count > b.lost
+            out.append({
+                "type": "summary",
+                "nodeId": node,
+                "peerId": peer,
+                "metric": metric,
+                "second": second,
+                "count": b.count,
+                "lost": b.lost,
+                "min": b.min if ok else None,
+                "max": b.max if ok else None,
+                # média e M2 (Welford) dos valores válidos
+                "mean": b.moments.mean,
+                "m2": b.moments.m2,
+                "sketch": b.sketch.to_dict(),
+                # fim do segundo, no relógio deste node
+                "timestamp": second + 1,
+            })
+        OPEN_BUCKETS.set(len(self.buckets))
+        return out
+
+
+def encode_batches(agent_id: str, summaries: List[dict],
+                   max_bytes: int = MAX_BATCH_BYTES) -> List[bytes]:
+    """Parte os resumos em lotes JSON de no máximo max_bytes cada."""
+    head = f'{{"type": "batch", "from": {json.dumps(agent_id)}, "timestamp": '
+    batches = []
+    parts: List[str] = []
+    size = 0
+    overhead = len(head) + 64
+
+    def close():
+        body = head + f'{time.time()!r}, "summaries": [' + ", ".join(parts) + "]}"
+        batches.append(body.encode())
+
+    for summary in summaries:
+        item = json.dumps(summary)
+        if len(item) + overhead > max_bytes:
+            print(f"[WARN] Summary too large for one datagram, dropped: "
+                  f"{summary['metric']} {summary['nodeId']}->{summary['peerId']}")
+            continue
+        if parts and size + len(item) + 2 + overhead > max_bytes:
+            close()
+            parts, size = [], 0
+        parts.append(item)
+        size += len(item) + 2
+    if parts:
+        close()
+    return batches
+
+
+def _make_raw_handler(log_file: Path):
+    class RawHandler(BaseHTTPRequestHandler):
+        """GET /raw?since=<epoch>&until=<epoch>&metric=<nome> -> JSON lines."""
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/raw":
+                self.send_error(404)
+                return
+            q = parse_qs(url.query)
+            try:
+                since = float(q.get("since", [0])[0])
+                until = float(q["until"][0]) if "until" in q else None
+            except ValueError:
+                self.send_error(400, "since/until must be epoch seconds")
+                return
+            metric = q.get("metric", [None])[0]
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            files = recent_log_files(log_file.parent, log_file, since)
+            for line in iter_log_lines(files, since=since):
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                ts = msg.get("timestamp")
+                if not isinstance(ts, (int, float)) or ts < since:
+                    continue
+                if until is not None and ts > until:
+                    continue
+                if metric is not None and msg.get("metric") != metric:
+                    continue
+                self.wfile.write(line.encode() if line.endswith("\n") else (line + "\n").encode())
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return RawHandler
+
+
+def run_node_collector(agent_id: str,
+                       upstream_ip: str,
+                       upstream_port: int = 5000,
+                       host: str = "127.0.0.1",
+                       port: int = 5000,
+                       pull_port: Optional[int] = 5080,
+                       metrics_port: Optional[int] = None,
+                       log_file: Path = LOCAL_LOG_FILE,
+                       flush_interval: float = 1.0,
+                       rotate_bytes: Optional[int] = 256 * 1024 * 1024,
+                       retain_segments: Optional[int] = None,
+                       node_budget: Optional[float] = None,
+                       slo_cfg: str = "config/slo.yaml") -> None:
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    previous = _rotate_log_if_exists(log_file)
+    log = RotatingLog(max_bytes=rotate_bytes, max_segments=retain_segments, log_file=log_file)
+    if previous is not None:
+        log.close_segment(previous)
+
+    if metrics_port:
+        start_metrics_server(metrics_port)
+
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind((host, port))
+    upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    inputs = [udp, upstream]
+
+    if pull_port:
+        server = ThreadingHTTPServer(("0.0.0.0", pull_port), _make_raw_handler(log_file))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"[NODE-COLLECTOR] Raw samples on http://0.0.0.0:{pull_port}/raw")
+
+    print(f"[NODE-COLLECTOR] {agent_id}: listening on {host}:{port}")
+    print(f"[NODE-COLLECTOR] Upstream: {upstream_ip}:{upstream_port}, raw log: {log_file}")
+
+    # deteção de SLOs/anomalias sobre as amostras em bruto (desligada se não houver config)
+    detector = StreamDetector.from_config(slo_cfg)
+    if detector is not None:
+        print(f"[NODE-COLLECTOR] SLO/anomaly detection enabled ({slo_cfg})")
+
+    agg = SecondAggregator()
+    # probes locais (endereços UDP): avisos de cenário e parte do orçamento
+    local_probes = ProbeRegistry(node_budget=node_budget)
+
+    def notify(notices) -> None:
+        for probe_addr, notice in notices:
+            try:
+                udp.sendto(json.dumps(notice).encode(), probe_addr)
+            except OSError as e:
+                print(f"[WARN] Failed to notify {probe_addr}: {e}")
+
+    # eventos do detetor à espera do próximo envio
+    pending_events: List[dict] = []
+
+    def detected(events) -> None:
+        for ev in events:
+            if scenario is not None:
+                ev["scenario"] = scenario
+            print(f"[DETECT] {ev}")
+            log.write(json.dumps(ev) + "\n")
+            pending_events.append(ev)
+
+    def send_events(now: float) -> None:
+        for i in range(0, len(pending_events), MAX_EVENTS_PER_DATAGRAM):
+            chunk = pending_events[i:i + MAX_EVENTS_PER_DATAGRAM]
+            body = json.dumps({"type": "events", "from": agent_id,
+                               "timestamp": now, "events": chunk}).encode()
+            try:
+                upstream.sendto(body, (upstream_ip, upstream_port))
+                EVENTS_SENT.inc(len(chunk))
+            except OSError as e:
+                print(f"[WARN] Failed to send events upstream: {e}")
+        pending_events.clear()
+
+    scenario = None
+    next_flush = time.time() + flush_interval
+    next_sweep = time.time() + detector.sweep_interval if detector is not None else math.inf
+
+    while True:
+        timeout = max(0.0, min(next_flush, next_sweep) - time.time())
+        readable, _, _ = select.select(inputs, [], [], timeout)
+        now = time.time()
+
+        for sock in readable:
+            try:
+                data, addr = sock.recvfrom(65535)
+            except OSError:
+                # ex: ICMP port unreachable do central (ainda em baixo)
+                continue
+
+            if sock is upstream:
+                try:
+                    notice = json.loads(data)
+                except ValueError:
+                    continue
+                if isinstance(notice, dict) and notice.get("type") == "scenario":
+                    scenario = notice.get("scenario")
+                    print(f"[NODE-COLLECTOR] Scenario is now {scenario}")
+                    notify(local_probes.set_scenario(scenario, now))
+                continue
+
+            try:
+                msg = json.loads(data)
+            except ValueError:
+                continue
+            if not isinstance(msg, dict):
+                continue
+            LOCAL_RECEIVED.inc()
+            if sock is udp:
+                notify(local_probes.seen(addr, msg.get("nodeId"), now))
+
+            msg["recv_timestamp"] = now
+            if scenario is not None:
+                msg["scenario"] = scenario
+            log.write(json.dumps(msg) + "\n")
+            agg.add(msg, now)
+            if detector is not None:
+                detected(detector.observe(msg, now))
+
+        if now >= next_sweep:
+            next_sweep = now + detector.sweep_interval
+            detected(detector.sweep(now))
+
+        if now >= next_flush:
+            next_flush = now + flush_interval
+            summaries = agg.pop_closed(now)
+            if summaries:
+                for batch in encode_batches(agent_id, summaries):
+                    try:
+                        upstream.sendto(batch, (upstream_ip, upstream_port))
+                        BATCH_BYTES.inc(len(batch))
+                    except OSError as e:
+                        print(f"[WARN] Failed to send batch upstream: {e}")
+                SUMMARIES_SENT.inc(len(summaries))
+            if pending_events:
+                send_events(now)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--node-id", required=True,
+                        help="ID deste node (identifica o agregador no central)")
+    parser.add_argument("--upstream-ip", required=True, help="IP do collector central")
+    parser.add_argument("--upstream-port", type=int, default=5000)
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Onde ouvir os probes locais (default: só loopback)")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--pull-port", type=int, default=5080,
+                        help="Porta HTTP para pedir as amostras em bruto (0 = desligado)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Se definido, expõe métricas internas em :PORT/metrics")
+    parser.add_argument("--log-file", default=str(LOCAL_LOG_FILE))
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="De quanto em quanto tempo enviar os segundos fechados (s)")
+    parser.add_argument("--rotate-mb", type=float, default=256,
+                        help="Roda o log local quando passa este tamanho (MB, 0 = nunca)")
+    parser.add_argument("--retain-segments", type=int, default=0,
+                        help="Apaga os segmentos locais mais antigos acima deste nº (default 0 = nunca apagar)")
+    parser.add_argument("--node-metric-budget", type=float, default=None,
+                        help="Métricas/s deste node, divididas pelos probes locais ativos")
+    parser.add_argument("--slo-cfg", default="config/slo.yaml",
+                        help="Regras de SLO/anomalias (se o ficheiro não existir, a deteção fica desligada)")
+    args = parser.parse_args()
+
+    run_node_collector(
+        agent_id=args.node_id,
+        upstream_ip=args.upstream_ip,
+        upstream_port=args.upstream_port,
+        host=args.host,
+        port=args.port,
+        pull_port=args.pull_port or None,
+        metrics_port=args.metrics_port,
+        log_file=Path(args.log_file),
+        flush_interval=args.flush_interval,
+        rotate_bytes=int(args.rotate_mb * 1024 * 1024) or None,
+        retain_segments=args.retain_segments or None,
+        node_budget=args.node_metric_budget,
+        slo_cfg=args.slo_cfg,
+    )
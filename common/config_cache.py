@@ -0,0 +1,70 @@
+"""
+Leitura dos ficheiros YAML de configuração com cache.
+
+Na primeira leitura o YAML é interpretado (PyYAML importado só aí) e o
+resultado fica guardado em <dir>/.cache/<ficheiro>.json, junto com o mtime
+e o tamanho do YAML. Nas seguintes, se o YAML não mudou, lê-se só o JSON
+(json em C, sem importar o PyYAML). Usa-se JSON e não pickle porque o manager
+corre com sudo nos nodes: a cache nunca pode executar código.
+
+Se os dados não sobreviverem a ida e volta em JSON (ex: chaves inteiras,
+datas) ou se não der para escrever a cache, lê-se sempre o YAML.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Union
+
+CACHE_DIRNAME = ".cache"
+CACHE_VERSION = 1
+
+
+def _cache_path(path: Path) -> Path:
+    return path.parent / CACHE_DIRNAME / (path.name + ".json")
+
+
+def _stamp(path: Path) -> list:
+    st = path.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _parse_yaml(path: Path) -> Any:
+    import yaml  # só quando a cache não serve
+
+    with path.open() as f:
+        return yaml.safe_load(f)
+
+
+def load_yaml_cached(path: Union[str, Path]) -> Any:
+    """Equivalente a yaml.safe_load(open(path)), com a cache descrita acima."""
+    path = Path(path)
+    stamp = _stamp(path)
+    cache = _cache_path(path)
+
+    try:
+        with cache.open() as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") == CACHE_VERSION and snapshot.get("stamp") == stamp:
+            return snapshot["data"]
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    data = _parse_yaml(path)
+
+    try:
+        encoded = json.dumps({"version": CACHE_VERSION, "stamp": stamp, "data": data})
+    except (TypeError, ValueError):
+        return data
+    if json.loads(encoded)["data"] != data:
+        return data
+
+    try:
+        cache.parent.mkdir(exist_ok=True)
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        tmp.write_text(encoded)
+        # rename atómico: leitores concorrentes nunca veem um JSON a meio
+        tmp.replace(cache)
+    except OSError:
+        pass
+    return data
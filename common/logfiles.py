@@ -0,0 +1,239 @@
+"""
+Leitura/escrita dos segmentos de log do collector.
+
+  logs/metrics.log                    -> segmento atual (texto)
+  logs/metrics-YYYYmmdd-HHMMSS.log    -> segmento fechado, ainda por comprimir
+  logs/metrics-YYYYmmdd-HHMMSS.log.gz -> segmento fechado e comprimido
+  logs/metrics-...log.gz.idx          -> índice dos blocos (JSON)
+  logs/.cache/<segmento>.cols.npz     -> pré-passagem colunar (reporting.fast_stats)
+
+O timestamp no nome é o instante em que o segmento foi fechado.
+Os .gz são escritos em blocos (um membro gzip por bloco de ~1MB de texto),
+o que continua a ser um .gz normal (zcat, gzip.open) mas permite, com o
+índice, saltar diretamente para o bloco onde começa um dado timestamp.
+"""
+
+import gzip
+import io
+import json
+import re
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Union
+
+PathLike = Union[str, Path]
+
+SEGMENT_RE = re.compile(r"^metrics-(\d{8}-\d{6})(?:-(\d+))?\.log(?:\.gz)?$")
+BLOCK_BYTES = 1 << 20
+CACHE_DIRNAME = ".cache"
+
+
+def columns_cache_path(path: PathLike) -> Path:
+    """Ficheiro da pré-passagem colunar de um log (escrito pelo reporting.fast_stats)."""
+    path = Path(path)
+    return path.parent / CACHE_DIRNAME / (path.name + ".cols.npz")
+
+
+def segment_close_time(path: PathLike) -> Optional[float]:
+    """Instante (epoch) em que o segmento foi fechado, a partir do nome."""
+    m = SEGMENT_RE.match(Path(path).name)
+    if not m:
+        return None
+    return time.mktime(time.strptime(m.group(1), "%Y%m%d-%H%M%S"))
+
+
+def _segment_order(path: Path):
+    m = SEGMENT_RE.match(path.name)
+    return segment_close_time(path), int(m.group(2) or 0)
+
+
+def log_sort_key(path: PathLike):
+    """
+    Ordem cronológica para uma lista de ficheiros de log: segmentos fechados
+    pelo instante de fecho e sufixo -N (não pelo nome, em que -10 viria antes
+    de -2), e os restantes (ex: o metrics.log atual) depois, pelo nome.
+    """
+    path = Path(path)
+    if SEGMENT_RE.match(path.name):
+        closed, n = _segment_order(path)
+        return 0, closed, n, str(path)
+    return 1, 0.0, 0, str(path)
+
+
+def list_segments(log_dir: PathLike) -> List[Path]:
+    """Segmentos fechados (comprimidos ou não), do mais antigo para o mais recente."""
+    names = {p.name: p for p in Path(log_dir).iterdir() if SEGMENT_RE.match(p.name)}
+    # durante a compressão existem X.log e X.log.gz ao mesmo tempo: o .gz só
+    # aparece quando está completo, por isso é esse que conta
+    segments = [p for name, p in names.items() if name + ".gz" not in names]
+    return sorted(segments, key=_segment_order)
+
+
+def new_segment_path(log_dir: PathLike) -> Path:
+    """Nome livre para um segmento fechado agora (sufixo -N se já existir)."""
+    log_dir = Path(log_dir)
+    ts = time.strftime("%Y%m%d-%H%M%S")
+    candidate = log_dir / f"metrics-{ts}.log"
+    n = 1
+    while candidate.exists() or candidate.with_name(candidate.name + ".gz").exists():
+        candidate = log_dir / f"metrics-{ts}-{n}.log"
+        n += 1
+    return candidate
+
+
+# qualquer timestamp de uma linha (timestamp, recv_timestamp, corrected_timestamp)
+_ANY_TS_RE = re.compile(rb'timestamp": (-?[0-9][0-9.eE+-]*)')
+
+
+def _max_timestamp(block: bytes) -> Optional[float]:
+    values = []
+    for raw in _ANY_TS_RE.findall(block):
+        try:
+            values.append(float(raw))
+        except ValueError:
+            continue
+    return max(values) if values else None
+
+
+def _line_timestamp(line: bytes) -> Optional[float]:
+    try:
+        msg = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(msg, dict):
+        return None
+    ts = msg.get("timestamp") or msg.get("recv_timestamp")
+    return ts if isinstance(ts, (int, float)) else None
+
+
+def compress_segment(src: PathLike, block_bytes: int = BLOCK_BYTES) -> Path:
+    """
+    Comprime um segmento fechado para <src>.gz em blocos alinhados às linhas
+    e escreve o índice <src>.gz.idx:
+      [[offset_comprimido, primeiro_timestamp, maior_timestamp], ...]
+    O maior timestamp é o máximo de todos os timestamps do bloco: as linhas
+    estão por ordem de chegada e os timestamps dos nodes (relógios diferentes,
+    resumos atrasados) não são monótonos, por isso o primeiro não chega para
+    saber se um bloco pode ser saltado. No fim apaga o original.
+    """
+    src = Path(src)
+    dst = src.with_name(src.name + ".gz")
+    tmp = dst.with_name(dst.name + ".tmp")
+    index = []
+
+    with src.open("rb") as fin, tmp.open("wb") as fout:
+        while True:
+            block = fin.read(block_bytes)
+            if not block:
+                break
+            # completar até ao fim da linha, para nenhum registo ficar partido
+            if not block.endswith(b"\n"):
+                block += fin.readline()
+
+            first_line = block.split(b"\n", 1)[0]
+            index.append([fout.tell(), _line_timestamp(first_line), _max_timestamp(block)])
+            fout.write(gzip.compress(block))
+
+    tmp.rename(dst)
+    Path(str(dst) + ".idx").write_text(json.dumps(index))
+    src.unlink()
+    # a cache do .log deixa de servir (a do .gz é escrita na próxima leitura)
+    columns_cache_path(src).unlink(missing_ok=True)
+    return dst
+
+
+def _open_gz_from(path: Path, since: Optional[float]):
+    """
+    Abre um .gz, saltando (pelo índice) os blocos iniciais em que nenhum
+    timestamp chega a 'since'. Os timestamps não são monótonos, por isso só se
+    salta até ao primeiro bloco com algum timestamp >= since (ou sem
+    timestamps); daí em diante lê-se tudo, mesmo blocos mais antigos.
+    """
+    raw = path.open("rb")
+    idx_path = Path(str(path) + ".idx")
+    if since is not None and idx_path.exists():
+        try:
+            index = json.loads(idx_path.read_text())
+        except ValueError:
+            index = []
+        if index:
+            # fim do ficheiro se nenhum bloco tiver timestamps >= since
+            start = path.stat().st_size
+            for offset, _first_ts, max_ts in index:
+                if max_ts is None or max_ts >= since:
+                    start = offset
+                    break
+            raw.seek(start)
+    return io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode="rb"))
+
+
+def open_log(path: PathLike, since: Optional[float] = None):
+    """
+    Abre um segmento (texto ou .gz) para leitura de linhas.
+    Com 'since', nos .gz com índice começa no bloco que contém esse instante
+    (as linhas anteriores podem aparecer na mesma; o filtro fica para quem lê).
+    """
+    path = Path(path)
+    if path.suffix == ".gz":
+        return _open_gz_from(path, since)
+    return path.open()
+
+
+def iter_log_lines(paths: Iterable[PathLike], since: Optional[float] = None) -> Iterator[str]:
+    for path in paths:
+        path = Path(path)
+        try:
+            f = open_log(path, since)
+        except FileNotFoundError:
+            # o segmento pode ter acabado de ser comprimido entre listar e abrir
+            gz = path.with_name(path.name + ".gz")
+            if path.suffix == ".gz" or not gz.exists():
+                continue
+            f = open_log(gz, since)
+        with f:
+            yield from f
+
+
+def recent_log_files(log_dir: PathLike, log_file: PathLike, since: float) -> List[Path]:
+    """
+    Ficheiros que podem ter registos posteriores a 'since': os segmentos fechados
+    depois desse instante (o mais antigo primeiro) e o segmento atual.
+    O instante de fecho é do relógio do collector: linhas de um node com o
+    relógio adiantado podem ter timestamp >= since num segmento fechado antes,
+    e ficam de fora (quem lê deve filtrar por corrected_timestamp).
+    """
+    files = []
+    log_dir = Path(log_dir)
+    if log_dir.exists():
+        for seg in list_segments(log_dir):
+            closed = segment_close_time(seg)
+            if closed is not None and closed >= since:
+                files.append(seg)
+    files.append(Path(log_file))
+    return files
+
+
+def apply_retention(log_dir: PathLike,
+                    max_segments: Optional[int] = None,
+                    max_total_bytes: Optional[int] = None) -> List[Path]:
+    """
+    Apaga os segmentos fechados mais antigos (com o índice e a pré-passagem
+    colunar de cada um) até cumprir os limites. Devolve os apagados.
+    """
+    segments = list_segments(log_dir)
+    removed = []
+
+    def total_size():
+        return sum(p.stat().st_size for p in segments)
+
+    while segments and (
+        (max_segments is not None and len(segments) > max_segments)
+        or (max_total_bytes is not None and total_size() > max_total_bytes)
+    ):
+        oldest = segments.pop(0)
+        oldest.unlink(missing_ok=True)
+        Path(str(oldest) + ".idx").unlink(missing_ok=True)
+        columns_cache_path(oldest).unlink(missing_ok=True)
+        removed.append(oldest)
+
+    return removed
@@ -0,0 +1,54 @@
+"""
+Média e variância incrementais (Welford) e junção de parciais (Chan et al.).
+
+Guardar n, média e M2 (soma dos quadrados dos desvios à média) em vez de
+soma e soma dos quadrados evita o cancelamento catastrófico de
+sumsq/n - média² quando a variância é pequena face à média (ex: RTTs
+de ~100ms com desvios de microssegundos).
+"""
+
+import math
+from typing import Optional, Tuple
+
+
+class Moments:
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, n: int, mean: float, m2: float) -> None:
+        """Junta um parcial (n, média, M2) calculado noutro sítio."""
+        if n <= 0:
+            return
+        if self.n == 0:
+            self.n, self.mean, self.m2 = n, mean, m2
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+
+    def std(self) -> float:
+        """Desvio padrão populacional (como statistics.pstdev)."""
+        return math.sqrt(max(self.m2, 0.0) / self.n) if self.n > 1 else 0.0
+
+
+def summary_moments(summary: dict) -> Optional[Tuple[int, float, float]]:
+    """
+    (n, média, M2) dos valores válidos de uma linha "summary" de um
+    node_collector, ou None se o segundo só teve perdas.
+    """
+    n = summary.get("count", 0) - summary.get("lost", 0)
+    if n <= 0:
+        return None
+    return n, summary["mean"], summary["m2"]
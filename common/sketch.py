@@ -0,0 +1,99 @@
+"""
+Sketch de quantis com erro relativo limitado (buckets logarítmicos, estilo DDSketch).
+
+Cada valor v != 0 vai para o bucket k = ceil(log(|v|) / log(gamma)), com
+gamma = (1 + a) / (1 - a). Qualquer quantil devolvido tem erro relativo <= a
+(a = 1% por omissão). A memória cresce com o log do intervalo de valores, não
+com o nº de amostras, e dois sketches juntam-se somando os buckets.
+"""
+
+import math
+from typing import Dict, Optional
+
+# abaixo disto (em valor absoluto) conta como zero
+MIN_ABS_VALUE = 1e-9
+
+
+class LogSketch:
+    def __init__(self, rel_accuracy: float = 0.01):
+        self.rel_accuracy = rel_accuracy
+        self.gamma = (1.0 + rel_accuracy) / (1.0 - rel_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.pos: Dict[int, int] = {}
+        self.neg: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+
+    def key(self, value: float) -> int:
+        return math.ceil(math.log(abs(value)) / self.log_gamma)
+
+    def add(self, value: float, count: int = 1) -> None:
+        self.count += count
+        if abs(value) < MIN_ABS_VALUE:
+            self.zero += count
+            return
+        bins = self.pos if value > 0 else self.neg
+        k = self.key(value)
+        bins[k] = bins.get(k, 0) + count
+
+    def add_bucket(self, k: int, count: int, negative: bool = False) -> None:
+        """Soma 'count' diretamente ao bucket k (usado por quem já calculou os índices)."""
+        bins = self.neg if negative else self.pos
+        bins[k] = bins.get(k, 0) + count
+        self.count += count
+
+    def add_zero(self, count: int) -> None:
+        self.zero += count
+        self.count += count
+
+    def merge(self, other: "LogSketch") -> None:
+        for k, c in other.pos.items():
+            self.pos[k] = self.pos.get(k, 0) + c
+        for k, c in other.neg.items():
+            self.neg[k] = self.neg.get(k, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+
+    def _bucket_value(self, k: int) -> float:
+        # ponto do bucket (gamma^(k-1), gamma^k] com erro relativo <= rel_accuracy
+        return 2.0 * self.gamma ** k / (self.gamma + 1.0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+
+        seen = 0
+        # negativos: do mais negativo (|v| maior) para o mais próximo de zero
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self._bucket_value(k)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._bucket_value(k)
+        return self._bucket_value(max(self.pos)) if self.pos else 0.0
+
+    def to_dict(self) -> dict:
+        """Forma compacta e serializável em JSON."""
+        d = {"a": self.rel_accuracy, "p": {str(k): c for k, c in self.pos.items()}}
+        if self.neg:
+            d["n"] = {str(k): c for k, c in self.neg.items()}
+        if self.zero:
+            d["z"] = self.zero
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "LogSketch":
+        sk = cls(d.get("a", 0.01))
+        for k, c in d.get("p", {}).items():
+            sk.add_bucket(int(k), c)
+        for k, c in d.get("n", {}).items():
+            sk.add_bucket(int(k), c, negative=True)
+        if d.get("z"):
+            sk.add_zero(d["z"])
+        return sk
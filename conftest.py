@@ -0,0 +1 @@
+# raiz do repositório no sys.path, para os testes importarem collector, common, ...
@@ -0,0 +1,258 @@
+"""
+Amostragem adaptativa partilhada pelos probes (probe_node, throughput_probe,
+app_latency_probe).
+
+  - AdaptiveSampler: intervalo por série. Começa no mínimo, entra em "burst"
+    (intervalo mínimo durante N amostras) quando muda a taxa de perda da
+    janela recente, quando um valor sai da baseline EWMA (k desvios) ou
+    quando muda o cenário ativo, e fora disso alarga o intervalo aos poucos
+    até ao máximo (série estável).
+  - MetricBudget: token bucket de métricas/s para o processo, que limita o
+    ritmo total independentemente do que os samplers pedem. O collector (ou
+    o node_collector) pode atribuir a cada probe a sua parte do orçamento do
+    node (aviso "budget"), que nunca passa do limite local.
+  - poll_notices: lê (sem bloquear) os avisos que o collector envia para o
+    socket de métricas (cenário ativo, orçamento).
+  - AdaptiveLoop: o ciclo comum aos probes (avisos, sampler por série ou
+    intervalo fixo, orçamento); cada probe só mede e chama tick().
+"""
+
+import json
+import math
+import socket
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+from common.selfmetrics import REGISTRY
+
+BURSTS = REGISTRY.counter(
+    "probe_adaptive_bursts_total", "Bursts de amostragem (motivo: loss, variance, scenario)")
+INTERVAL = REGISTRY.gauge(
+    "probe_sample_interval_seconds", "Intervalo de amostragem atual por série")
+THROTTLED_SECONDS = REGISTRY.counter(
+    "probe_budget_throttled_seconds_total", "Tempo de espera imposto pelo orçamento de métricas")
+
+
+class AdaptiveSampler:
+    def __init__(self,
+                 min_interval: float,
+                 max_interval: float,
+                 alpha: float = 0.2,
+                 k_sigma: float = 3.0,
+                 min_samples: int = 5,
+                 burst_samples: int = 10,
+                 backoff: float = 1.25,
+                 loss_window: int = 20,
+                 loss_delta: float = 0.15,
+                 label: str = ""):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("é preciso 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.alpha = alpha
+        self.k_sigma = k_sigma
+        self.min_samples = min_samples
+        self.burst_samples = burst_samples
+        self.backoff = backoff
+        self.label = label
+
+        # perdas nas últimas 'loss_window' amostras; burst quando a taxa
+        # (sobre a janela inteira) se afasta 'loss_delta' da do último burst
+        self.outcomes = deque(maxlen=loss_window)
+        self.n_lost = 0
+        self.loss_delta = loss_delta
+        self.loss_ref = 0.0
+
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+        # começa em burst para aprender a baseline depressa
+        self.burst_left = burst_samples
+        self.interval = min_interval
+
+    def trigger(self, reason: str) -> None:
+        """Força um burst (ex: mudança de cenário)."""
+        if self.burst_left == 0:
+            BURSTS.inc(reason=reason)
+        self.burst_left = self.burst_samples
+        self.interval = self.min_interval
+        INTERVAL.set(self.interval, series=self.label)
+
+    def observe(self, value: Optional[float]) -> float:
+        """Regista uma amostra (None = perda) e devolve o intervalo até à próxima."""
+        lost = value is None
+        if len(self.outcomes) == self.outcomes.maxlen and self.outcomes[0]:
+            self.n_lost -= 1
+        self.outcomes.append(lost)
+        if lost:
+            self.n_lost += 1
+        # uma perda isolada num link com perda estável não é mudança; subir
+        # (ou voltar a descer) a taxa é
+        loss_rate = self.n_lost / self.outcomes.maxlen
+        if abs(loss_rate - self.loss_ref) >= self.loss_delta:
+            self.loss_ref = loss_rate
+            self.trigger("loss")
+
+        if not lost:
+            if self.n >= self.min_samples and self.var > 0.0:
+                if abs(value - self.mean) > self.k_sigma * math.sqrt(self.var):
+                    self.trigger("variance")
+            # baseline EWMA (mesma forma que o detetor do collector)
+            if self.n == 0:
+                self.mean = value
+            else:
+                diff = value - self.mean
+                incr = self.alpha * diff
+                self.mean += incr
+                self.var = (1.0 - self.alpha) * (self.var + diff * incr)
+            self.n += 1
+
+        if self.burst_left > 0:
+            self.burst_left -= 1
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        INTERVAL.set(self.interval, series=self.label)
+        return self.interval
+
+
+class MetricBudget:
+    """
+    Token bucket de 'rate' métricas/s (com rajada até 'burst').
+    reserve(n) consome já os tokens (o saldo pode ficar negativo) e devolve
+    quanto tempo esperar antes de voltar a medir para respeitar o ritmo.
+    'rate' é também o limite local: assign() não o ultrapassa.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate tem de ser > 0")
+        self.limit = rate
+        self.rate = rate
+        self.burst = burst
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def assign(self, rate: float) -> None:
+        """Ritmo atribuído pelo collector (parte do orçamento do node)."""
+        if rate <= 0:
+            return
+        self.rate = min(rate, self.limit)
+        if self.burst is None:
+            self.capacity = max(self.rate, 1.0)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def reserve(self, n: int = 1) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= n
+        if self.tokens >= 0:
+            return 0.0
+        wait = -self.tokens / self.rate
+        THROTTLED_SECONDS.inc(wait)
+        return wait
+
+
+def poll_notices(sock: socket.socket) -> Dict[str, dict]:
+    """
+    Esvazia (sem bloquear) as respostas do collector no socket de métricas.
+    Devolve o último aviso de cada tipo, ex:
+      {"scenario": {"type": "scenario", "scenario": ...},
+       "budget": {"type": "budget", "rate": 2.5}}
+    """
+    notices = {}
+    while True:
+        try:
+            data, _addr = sock.recvfrom(2048, socket.MSG_DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            return notices
+        except OSError:
+            # ex: ICMP port unreachable de um envio anterior (collector em baixo)
+            return notices
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            continue
+        if isinstance(msg, dict) and msg.get("type") in ("scenario", "budget"):
+            notices[msg["type"]] = msg
+
+
+def apply_budget_notice(budget: Optional[MetricBudget],
+                        notice: Optional[dict]) -> Optional[MetricBudget]:
+    """Aplica um aviso "budget" (cria o MetricBudget se o probe não tinha limite local)."""
+    if notice is None:
+        return budget
+    try:
+        rate = float(notice.get("rate"))
+    except (TypeError, ValueError):
+        return budget
+    if not math.isfinite(rate) or rate <= 0:
+        return budget
+    if budget is None:
+        budget = MetricBudget(rate)
+        # sem limite local: segue sempre o que o collector atribuir
+        budget.limit = math.inf
+        return budget
+    budget.assign(rate)
+    return budget
+
+
+class AdaptiveLoop:
+    """
+    Estado partilhado pelo ciclo de medição de um probe:
+      - um AdaptiveSampler por série (com --adaptive) ou o intervalo fixo;
+      - o MetricBudget local, ajustado pelos avisos "budget" do collector;
+      - o cenário ativo, que ao mudar põe todos os samplers em burst.
+
+    Probes com uma só série fazem, depois de cada medição:
+        time.sleep(loop.tick(value, series=peer_id))
+    """
+
+    def __init__(self,
+                 sock: socket.socket,
+                 interval: float,
+                 adaptive: bool = False,
+                 min_interval: float = 0.2,
+                 max_interval: float = 5.0,
+                 metric_budget: Optional[float] = None,
+                 series: Iterable[str] = ("",),
+                 label_prefix: str = ""):
+        self.sock = sock
+        self.interval = interval
+        self.samplers: Dict[str, AdaptiveSampler] = {}
+        if adaptive:
+            self.samplers = {
+                name: AdaptiveSampler(min_interval, max_interval, label=label_prefix + name)
+                for name in series
+            }
+        self.budget = MetricBudget(metric_budget) if metric_budget else None
+        self.scenario = None
+
+    def poll(self) -> bool:
+        """Aplica os avisos pendentes do collector; True se o cenário mudou."""
+        notices = poll_notices(self.sock)
+        self.budget = apply_budget_notice(self.budget, notices.get("budget"))
+        notice = notices.get("scenario")
+        if notice is None or notice.get("scenario") == self.scenario:
+            return False
+        self.scenario = notice.get("scenario")
+        for sampler in self.samplers.values():
+            sampler.trigger("scenario")
+        return True
+
+    def throttle(self, n_sent: int = 1) -> float:
+        """Espera imposta pelo orçamento depois de enviar n_sent métricas."""
+        return self.budget.reserve(n_sent) if self.budget is not None else 0.0
+
+    def next_interval(self, value: Optional[float], series: str = "") -> float:
+        """Regista a medição (None = perda) e devolve o intervalo até medir de novo a série."""
+        sampler = self.samplers.get(series)
+        return sampler.observe(value) if sampler is not None else self.interval
+
+    def tick(self, value: Optional[float], n_sent: int = 1, series: str = "") -> float:
+        """Depois de uma medição: avisos, intervalo e orçamento. Devolve quanto esperar."""
+        self.poll()
+        return max(self.next_interval(value, series), self.throttle(n_sent))
@@ -4,8 +4,13 @@ import time
 import argparse
 from typing import Optional
 
+from common.selfmetrics import REGISTRY, start_metrics_server
+from .adaptive import AdaptiveLoop
 from .probe_node import send_metric
 
+APP_TIMEOUTS = REGISTRY.counter(
+    "app_latency_timeouts_total", "Pedidos à aplicação sem resposta")
+
 
 def measure_app_latency_ms(host: str,
                            port: int,
@@ -42,15 +47,34 @@ def main():
     parser.add_argument("--collector-port", type=int, default=5000)
     parser.add_argument("--interval", type=float, default=2.0,
                         help="Intervalo entre medições (s)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Se definido, expõe métricas internas em :PORT/metrics")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Intervalo adaptativo (burst em perda/variância/cenário, backoff se estável)")
+    parser.add_argument("--min-interval", type=float, default=0.5,
+                        help="Com --adaptive: intervalo mínimo (s)")
+    parser.add_argument("--max-interval", type=float, default=10.0,
+                        help="Com --adaptive: intervalo máximo (s)")
+    parser.add_argument("--metric-budget", type=float, default=None,
+                        help="Máximo de métricas/s enviadas por este processo")
     args = parser.parse_args()
 
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
     metrics_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    loop = AdaptiveLoop(metrics_sock, args.interval, adaptive=args.adaptive,
+                        min_interval=args.min_interval, max_interval=args.max_interval,
+                        metric_budget=args.metric_budget,
+                        series=[args.peer_id], label_prefix=f"{args.node_id}->")
 
     while True:
         latency_ms = measure_app_latency_ms(
             host=args.service_host,
             port=args.service_port,
         )
+        if latency_ms is None:
+            APP_TIMEOUTS.inc(peer=args.peer_id)
 
         send_metric(
             metrics_sock,
@@ -65,7 +89,7 @@ def main():
         print(f"[APP-LATENCY] {args.node_id}->{args.peer_id} "
               f"= {latency_ms if latency_ms is not None else 'TIMEOUT'} ms")
 
-        time.sleep(args.interval)
+        time.sleep(loop.tick(latency_ms, series=args.peer_id))
 
 
 if __name__ == "__main__":
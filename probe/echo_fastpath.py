@@ -0,0 +1,167 @@
+# probe/echo_fastpath.py
+import os
+import select
+import socket
+import struct
+import sys
+import time
+import argparse
+from typing import Optional
+
+from .probe_node import stamp_echo_reply, send_metric
+
+# SO_TIMESTAMP: instante (struct timeval) em que o kernel recebeu o datagrama.
+# O módulo socket não exporta a constante; em Linux vale 29 (= SCM_TIMESTAMP).
+SO_TIMESTAMP = getattr(socket, "SO_TIMESTAMP", 29 if sys.platform.startswith("linux") else None)
+_TIMEVAL = struct.Struct("@ll")
+
+
+def _pin_to_cpu(cpu: Optional[int]) -> None:
+    if cpu is None:
+        return
+    try:
+        os.sched_setaffinity(0, {cpu})
+        print(f"[ECHO-FAST] Pinned to CPU {cpu}")
+    except (AttributeError, OSError) as e:
+        print(f"[ECHO-FAST] Não foi possível fixar no CPU {cpu}: {e}")
+
+
+def _enable_kernel_timestamps(sock: socket.socket) -> bool:
+    if SO_TIMESTAMP is None:
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _kernel_timestamp(ancdata) -> Optional[float]:
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMP and len(data) >= _TIMEVAL.size:
+            sec, usec = _TIMEVAL.unpack_from(data)
+            return sec + usec / 1e6
+    return None
+
+
+def run_fast_echo(bind_ip: str,
+                  bind_port: int,
+                  cpu: Optional[int] = None,
+                  batch: int = 64,
+                  node_id: Optional[str] = None,
+                  collector_ip: Optional[str] = None,
+                  collector_port: int = 5000,
+                  report_interval: float = 5.0) -> None:
+    """
+    Echo UDP para correr num processo próprio (fora do GIL do prober),
+    opcionalmente fixo num CPU.
+
+    Espera com poll() e responde a cada datagrama logo que o lê (com t2/t3
+    nos PINGs), sem juntar um lote antes de responder; 'batch' só limita
+    quantos se tratam por cada poll() antes de ver se há relatório a enviar.
+
+    Com SO_TIMESTAMP, t2 e o tempo de serviço contam a partir do instante em
+    que o kernel recebeu o datagrama, por isso incluem o tempo à espera no
+    buffer do socket. Sem ele (outro SO), contam a partir do recvfrom e esse
+    tempo de fila fica escondido (aparece só no RTT de quem mede).
+    Se houver collector, envia periodicamente echo_service_us (média) e
+    echo_service_max_us com peerId "ECHO".
+    """
+    _pin_to_cpu(cpu)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind((bind_ip, bind_port))
+    sock.setblocking(False)
+    kernel_ts = _enable_kernel_timestamps(sock)
+    ancbufsize = socket.CMSG_SPACE(_TIMEVAL.size) if kernel_ts else 0
+
+    poller = select.poll()
+    poller.register(sock, select.POLLIN)
+
+    metrics_sock = None
+    if collector_ip and node_id:
+        metrics_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    print(f"[ECHO-FAST] Listening on {bind_ip}:{bind_port} "
+          f"(batch={batch}, kernel timestamps={'on' if kernel_ts else 'off'}, pid={os.getpid()})")
+
+    n_served = 0
+    n_dropped = 0
+    service_sum = 0.0
+    service_max = 0.0
+    next_report = time.monotonic() + report_interval
+
+    while True:
+        poller.poll(1000)
+
+        # responder a cada datagrama assim que é lido (até 'batch' por poll)
+        for _ in range(batch):
+            try:
+                data, ancdata, _flags, addr = sock.recvmsg(2048, ancbufsize)
+            except BlockingIOError:
+                break
+            t_read = time.time()
+            t_recv = _kernel_timestamp(ancdata) if kernel_ts else None
+            if t_recv is None:
+                t_recv = t_read
+            try:
+                sock.sendto(stamp_echo_reply(data, t_recv), addr)
+            except BlockingIOError:
+                # buffer de envio cheio: a resposta perde-se como numa rede real
+                n_dropped += 1
+                continue
+            service = max(time.time() - t_recv, 0.0)
+            n_served += 1
+            service_sum += service
+            if service > service_max:
+                service_max = service
+
+        now = time.monotonic()
+        if now >= next_report:
+            next_report = now + report_interval
+            if n_served:
+                avg_us = service_sum / n_served * 1e6
+                max_us = service_max * 1e6
+                print(f"[ECHO-FAST] served={n_served} dropped={n_dropped} "
+                      f"service avg={avg_us:.1f}us max={max_us:.1f}us")
+                if metrics_sock is not None:
+                    send_metric(metrics_sock, collector_ip, collector_port,
+                                node_id, "ECHO", "echo_service_us", avg_us)
+                    send_metric(metrics_sock, collector_ip, collector_port,
+                                node_id, "ECHO", "echo_service_max_us", max_us)
+            n_served = 0
+            n_dropped = 0
+            service_sum = 0.0
+            service_max = 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--cpu", type=int, default=None,
+                        help="CPU onde fixar o processo do echo")
+    parser.add_argument("--batch", type=int, default=64,
+                        help="Máximo de datagramas tratados (um a um) por cada poll()")
+    parser.add_argument("--node-id", default=None,
+                        help="Se definido (com --collector-ip), reporta o tempo de serviço")
+    parser.add_argument("--collector-ip", default=None)
+    parser.add_argument("--collector-port", type=int, default=5000)
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    run_fast_echo(
+        args.ip,
+        args.port,
+        cpu=args.cpu,
+        batch=args.batch,
+        node_id=args.node_id,
+        collector_ip=args.collector_ip,
+        collector_port=args.collector_port,
+        report_interval=args.report_interval,
+    )
+
+
+if __name__ == "__main__":
+    main()
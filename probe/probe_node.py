@@ -3,23 +3,52 @@ import json
 import time
 import argparse
 import threading
-from pathlib import Path
-from typing import Optional
+import itertools
+from collections import deque
+from typing import Dict, Optional
 
-import yaml  # pip install pyyaml
+from common.config_cache import load_yaml_cached
+from common.selfmetrics import REGISTRY, start_metrics_server
+from .adaptive import AdaptiveLoop
+
+PROBE_ROUND_SECONDS = REGISTRY.histogram(
+    "probe_round_seconds", "Duração de uma ronda de medição a todos os peers")
+PROBE_TIMEOUTS = REGISTRY.counter(
+    "probe_timeouts_total", "PINGs sem resposta dentro do timeout")
+METRICS_SENT = REGISTRY.counter(
+    "probe_metrics_sent_total", "Métricas enviadas ao collector")
 
 
 def load_nodes_config(path: str = "config/nodes.yaml") -> dict:
-    cfg_path = Path(path)
-    with cfg_path.open() as f:
-        data = yaml.safe_load(f)
+    # cache JSON do YAML: sem importar/interpretar o PyYAML a cada arranque
+    data = load_yaml_cached(path)
     return data["nodes"]
 
 
+def stamp_echo_reply(data: bytes, t_recv: float) -> bytes:
+    """
+    Resposta do echo a um datagrama. Aos PINGs JSON acrescenta, estilo NTP,
+    o instante de receção (t2) e de envio (t3) no relógio deste node.
+    Tudo o resto (ex: payloads do throughput_probe) é devolvido tal e qual.
+    """
+    if not data.startswith(b"{"):
+        return data
+    try:
+        msg = json.loads(data)
+    except ValueError:
+        return data
+    if not isinstance(msg, dict) or msg.get("type") != "PING":
+        return data
+
+    msg["t2"] = t_recv
+    msg["t3"] = time.time()
+    return json.dumps(msg).encode()
+
+
 def echo_server(bind_ip: str, bind_port: int) -> None:
     """
-    Pequeno servidor UDP que apenas ecoa de volta o que recebe.
-    Serve para outros nodes medirem RTT.
+    Pequeno servidor UDP que ecoa de volta o que recebe (com os timestamps
+    t2/t3 nos PINGs). Serve para outros nodes medirem RTT e one-way delay.
     """
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((bind_ip, bind_port))
@@ -27,36 +56,122 @@ def echo_server(bind_ip: str, bind_port: int) -> None:
 
     while True:
         data, addr = sock.recvfrom(2048)
-        # devolve exatamente o que recebeu
-        sock.sendto(data, addr)
+        t_recv = time.time()
+        sock.sendto(stamp_echo_reply(data, t_recv), addr)
 
 
-def measure_rtt_to_peer(sock: socket.socket,
-                        peer_id: str,
-                        peer_info: dict,
-                        timeout: float = 1.0) -> Optional[float]:
+_ping_seq = itertools.count()
+
+
+def ping_peer(sock: socket.socket,
+              peer_id: str,
+              peer_info: dict,
+              timeout: float = 1.0) -> Optional[dict]:
     """
-    Envia um PING UDP para o peer e mede o RTT (ms).
+    Envia um PING UDP para o peer e devolve os 4 timestamps NTP:
+      t1 = envio (local), t2 = receção no peer, t3 = envio do peer, t4 = receção (local)
+    t2/t3 ficam a None se o peer usar um echo antigo (sem timestamps).
+    Respostas atrasadas de PINGs anteriores (seq diferente) são descartadas.
     Se não houver resposta no timeout, devolve None (perda).
     """
+    seq = next(_ping_seq)
     msg = {
         "type": "PING",
         "to": peer_id,
+        "seq": seq,
         "ts": time.time(),
     }
     payload = json.dumps(msg).encode()
 
-    start = time.time()
-    sock.settimeout(timeout)
+    t1 = time.time()
+    deadline = t1 + timeout
     try:
+        sock.settimeout(timeout)
         sock.sendto(payload, (peer_info["ip"], peer_info["port"]))
-        _data, _addr = sock.recvfrom(2048)
+        while True:
+            data, _addr = sock.recvfrom(2048)
+            t4 = time.time()
+            try:
+                reply = json.loads(data)
+            except ValueError:
+                reply = None
+            if isinstance(reply, dict) and reply.get("seq") == seq:
+                break
+            remaining = deadline - t4
+            if remaining <= 0:
+                return None
+            sock.settimeout(remaining)
     except socket.timeout:
         return None
-    end = time.time()
 
-    rtt_ms = (end - start) * 1000.0
-    return rtt_ms
+    return {"t1": t1, "t2": reply.get("t2"), "t3": reply.get("t3"), "t4": t4}
+
+
+def measure_rtt_to_peer(sock: socket.socket,
+                        peer_id: str,
+                        peer_info: dict,
+                        timeout: float = 1.0) -> Optional[float]:
+    """
+    Envia um PING UDP para o peer e mede o RTT (ms).
+    Se não houver resposta no timeout, devolve None (perda).
+    """
+    sample = ping_peer(sock, peer_id, peer_info, timeout)
+    if sample is None:
+        return None
+    return (sample["t4"] - sample["t1"]) * 1000.0
+
+
+class ClockOffsetEstimator:
+    """
+    Estimativa do offset do relógio de um peer (peer - local), estilo NTP:
+      offset = ((t2 - t1) + (t3 - t4)) / 2
+      delay  = (t4 - t1) - (t3 - t2)
+    Usa-se a amostra de menor delay num horizonte longo ('horizon' segundos):
+    o offset só muda quando aparece um caminho mais rápido ou quando a melhor
+    amostra sai do horizonte, não a cada ronda.
+
+    A fórmula assume ida = volta. Sem uma referência externa (relógios
+    sincronizados, mesmo host) uma assimetria do caminho não é observável:
+    aparece como offset, metade para cada lado. Por isso o offset não segue as
+    amostras recentes (uma falha assimétrica seria absorvida e o owd_fwd/owd_rev
+    voltaria a parecer simétrico); com o horizonte longo a melhor amostra é a
+    do período antes da falha. Com 'fixed_offset' (ex: 0 quando os dois nodes
+    partilham o relógio) não se estima nada e a assimetria é medida diretamente.
+    """
+
+    def __init__(self, horizon: float = 3600.0, fixed_offset: Optional[float] = None):
+        self.horizon = horizon
+        self.fixed_offset = fixed_offset
+        # (instante, delay, offset) com delay crescente: a cabeça é a melhor amostra
+        self.best = deque()
+        self.offset: Optional[float] = fixed_offset
+
+    def update(self, t1: float, t2: float, t3: float, t4: float) -> float:
+        if self.fixed_offset is not None:
+            return self.fixed_offset
+
+        offset = ((t2 - t1) + (t3 - t4)) / 2.0
+        delay = (t4 - t1) - (t3 - t2)
+        # mínimo numa janela deslizante (deque monotónica)
+        while self.best and self.best[-1][1] >= delay:
+            self.best.pop()
+        self.best.append((t4, delay, offset))
+        while self.best[0][0] < t4 - self.horizon:
+            self.best.popleft()
+
+        self.offset = self.best[0][2]
+        return self.offset
+
+    def one_way_delays(self, t1: float, t2: float, t3: float, t4: float):
+        """(ida, volta) em segundos, corrigidos pelo offset estimado."""
+        fwd = (t2 - self.offset) - t1
+        rev = t4 - (t3 - self.offset)
+        return fwd, rev
+
+
+def _same_host(ip_a: str, ip_b: str) -> bool:
+    """Dois nodes no mesmo IP ou ambos em loopback partilham o relógio."""
+    return ip_a == ip_b or (ip_a.startswith("127.") and ip_b.startswith("127."))
 
 
 def send_metric(metrics_sock: socket.socket,
@@ -75,6 +190,7 @@ def send_metric(metrics_sock: socket.socket,
     }
     metrics_sock.sendto(json.dumps(msg).encode(),
                         (collector_ip, collector_port))
+    METRICS_SENT.inc(metric=metric_name)
     print(f"[PROBE {node_id}] Sent metric: {msg}")
 
 
@@ -82,7 +198,17 @@ def run_probe(node_id: str,
               collector_ip: str = "127.0.0.1",
               collector_port: int = 5000,
               nodes_cfg_path: str = "config/nodes.yaml",
-              interval: float = 1.0) -> None:
+              interval: float = 1.0,
+              metrics_port: Optional[int] = None,
+              one_way: bool = False,
+              clock_offset: Optional[float] = None,
+              clock_horizon: float = 3600.0,
+              echo_mode: str = "thread",
+              echo_cpu: Optional[int] = None,
+              adaptive: bool = False,
+              min_interval: float = 0.2,
+              max_interval: float = 5.0,
+              metric_budget: Optional[float] = None) -> None:
     # Carregar configuração dos nodes
     nodes = load_nodes_config(nodes_cfg_path)
     if node_id not in nodes:
@@ -90,40 +216,135 @@ def run_probe(node_id: str,
 
     my_info = nodes[node_id]
 
-    # Lançar echo server numa thread separada
-    echo_thread = threading.Thread(
-        target=echo_server,
-        args=(my_info["ip"], my_info["port"]),
-        daemon=True,
-    )
-    echo_thread.start()
+    if metrics_port:
+        start_metrics_server(metrics_port)
+
+    if echo_mode == "process":
+        # Echo num processo próprio (fora do GIL do prober), opcionalmente
+        # fixo num CPU; reporta o seu tempo de serviço
+        import multiprocessing
+
+        from .echo_fastpath import run_fast_echo
 
-    # Socket para medir RTT para os peers
+        echo_proc = multiprocessing.Process(
+            target=run_fast_echo,
+            args=(my_info["ip"], my_info["port"]),
+            kwargs={
+                "cpu": echo_cpu,
+                "node_id": node_id,
+                "collector_ip": collector_ip,
+                "collector_port": collector_port,
+            },
+            daemon=True,
+        )
+        echo_proc.start()
+    else:
+        # Lançar echo server numa thread separada
+        echo_thread = threading.Thread(
+            target=echo_server,
+            args=(my_info["ip"], my_info["port"]),
+            daemon=True,
+        )
+        echo_thread.start()
+
+    # Socket para medir RTT para os peers. Fica ligado ao IP deste node para
+    # que os filtros tc das regras 'link' consigam identificar a origem.
     ping_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ping_sock.bind((my_info["ip"], 0))
     # Socket separado para enviar métricas ao collector
     metrics_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
     # Lista de peers (todos menos eu)
     peers = {nid: info for nid, info in nodes.items() if nid != node_id}
+    # offset de relógio por peer (para one-way delay): fixo com clock_offset,
+    # 0 para peers no mesmo host, estimado para os restantes
+    clocks = {}
+    for peer_id, info in peers.items():
+        fixed = clock_offset
+        if fixed is None and _same_host(my_info["ip"], info["ip"]):
+            fixed = 0.0
+        clocks[peer_id] = ClockOffsetEstimator(horizon=clock_horizon, fixed_offset=fixed)
+    # último clock_offset_ms enviado por peer: só se volta a enviar quando muda
+    sent_offsets: Dict[str, float] = {}
 
     print(f"[PROBE {node_id}] Peers: {list(peers.keys())}")
     print(f"[PROBE {node_id}] Collector: {collector_ip}:{collector_port}")
 
+    # avisos do collector, orçamento e (com adaptive) um sampler por peer
+    loop = AdaptiveLoop(metrics_sock, interval, adaptive=adaptive,
+                        min_interval=min_interval, max_interval=max_interval,
+                        metric_budget=metric_budget,
+                        series=peers, label_prefix=f"{node_id}->")
+
+    def measure(peer_id: str) -> Optional[float]:
+        """Mede um peer, envia as métricas e devolve o RTT (None = perda)."""
+        sample = ping_peer(ping_sock, peer_id, peers[peer_id])
+        n_sent = 1
+        # rtt=None significa perda/timeout
+        if sample is None:
+            rtt = None
+            PROBE_TIMEOUTS.inc(peer=peer_id)
+        else:
+            rtt = (sample["t4"] - sample["t1"]) * 1000.0
+        send_metric(
+            metrics_sock,
+            collector_ip,
+            collector_port,
+            node_id,
+            peer_id,
+            "rtt_ms",
+            rtt,
+        )
+
+        if one_way and sample is not None and sample["t2"] is not None:
+            ts4 = (sample["t1"], sample["t2"], sample["t3"], sample["t4"])
+            clock = clocks[peer_id]
+            offset = clock.update(*ts4)
+            fwd, rev = clock.one_way_delays(*ts4)
+            values = [("owd_fwd_ms", fwd), ("owd_rev_ms", rev)]
+            if sent_offsets.get(peer_id) != offset:
+                sent_offsets[peer_id] = offset
+                values.append(("clock_offset_ms", offset))
+            for metric_name, value in values:
+                send_metric(metrics_sock, collector_ip, collector_port,
+                            node_id, peer_id, metric_name, value * 1000.0)
+            n_sent += len(values)
+
+        wait = loop.throttle(n_sent)
+        if wait > 0:
+            time.sleep(wait)
+        return rtt
+
+    if not adaptive:
+        while True:
+            # o collector pode atribuir a este probe uma parte do orçamento do node
+            loop.poll()
+            round_start = time.perf_counter()
+            # para cada peer, medir RTT e enviar métrica
+            for peer_id in peers:
+                measure(peer_id)
+            PROBE_ROUND_SECONDS.observe(time.perf_counter() - round_start)
+            time.sleep(interval)
+
+    # modo adaptativo: cada peer tem o seu intervalo e a sua próxima medição
+    due = {peer_id: 0.0 for peer_id in peers}
+
     while True:
-        # para cada peer, medir RTT e enviar métrica
-        for peer_id, peer_info in peers.items():
-            rtt = measure_rtt_to_peer(ping_sock, peer_id, peer_info)
-            # rtt=None significa perda/timeout
-            send_metric(
-                metrics_sock,
-                collector_ip,
-                collector_port,
-                node_id,
-                peer_id,
-                "rtt_ms",
-                rtt,
-            )
-        time.sleep(interval)
+        if loop.poll():
+            print(f"[PROBE {node_id}] Scenario changed to {loop.scenario}: sampling burst")
+            due = dict.fromkeys(peers, 0.0)
+
+        now = time.monotonic()
+        for peer_id in peers:
+            if due[peer_id] <= now:
+                rtt = measure(peer_id)
+                due[peer_id] = time.monotonic() + loop.next_interval(rtt, peer_id)
+
+        # acordar a tempo da próxima medição, mas sem adormecer mais do que
+        # o intervalo mínimo (para ver avisos de cenário depressa)
+        sleep_for = min(min(due.values()) - time.monotonic(), min_interval)
+        if sleep_for > 0:
+            time.sleep(sleep_for)
 
 
 if __name__ == "__main__":
@@ -134,6 +355,27 @@ if __name__ == "__main__":
     parser.add_argument("--nodes-cfg", default="config/nodes.yaml")
     parser.add_argument("--interval", type=float, default=1.0,
                         help="Intervalo entre rondas de medição (s)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Se definido, expõe métricas internas em :PORT/metrics")
+    parser.add_argument("--one-way", action="store_true",
+                        help="Enviar também owd_fwd_ms / owd_rev_ms (e clock_offset_ms quando muda)")
+    parser.add_argument("--clock-offset", type=float, default=None,
+                        help="Offset de relógio fixo (ms) para todos os peers, ex: 0 se partilham o relógio "
+                             "(default: 0 para peers no mesmo host, estimado para os outros)")
+    parser.add_argument("--clock-horizon", type=float, default=3600.0,
+                        help="Horizonte (s) da amostra de menor delay usada para estimar o offset")
+    parser.add_argument("--echo-mode", choices=["thread", "process"], default="thread",
+                        help="Echo UDP numa thread (default) ou num processo dedicado")
+    parser.add_argument("--echo-cpu", type=int, default=None,
+                        help="Com --echo-mode process: CPU onde fixar o echo")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Intervalo adaptativo por peer (burst em perda/variância/cenário, backoff se estável)")
+    parser.add_argument("--min-interval", type=float, default=0.2,
+                        help="Com --adaptive: intervalo mínimo (s)")
+    parser.add_argument("--max-interval", type=float, default=5.0,
+                        help="Com --adaptive: intervalo máximo (s)")
+    parser.add_argument("--metric-budget", type=float, default=None,
+                        help="Máximo de métricas/s enviadas por este processo")
     args = parser.parse_args()
 
     run_probe(
@@ -142,4 +384,14 @@ if __name__ == "__main__":
         collector_port=args.collector_port,
         nodes_cfg_path=args.nodes_cfg,
         interval=args.interval,
+        metrics_port=args.metrics_port,
+        one_way=args.one_way,
+        clock_offset=None if args.clock_offset is None else args.clock_offset / 1000.0,
+        clock_horizon=args.clock_horizon,
+        echo_mode=args.echo_mode,
+        echo_cpu=args.echo_cpu,
+        adaptive=args.adaptive,
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        metric_budget=args.metric_budget,
     )
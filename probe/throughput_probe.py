@@ -4,16 +4,18 @@ import time
 import argparse
 from typing import Optional
 
-from pathlib import Path
-import yaml
-
+from common.config_cache import load_yaml_cached
+from common.selfmetrics import REGISTRY, start_metrics_server
+from .adaptive import AdaptiveLoop
 from .probe_node import send_metric  # reaproveitar função existente
 
+MEASURE_SECONDS = REGISTRY.histogram(
+    "throughput_measure_seconds", "Duração de uma medição de throughput")
+
 
 def load_nodes_config(path: str = "config/nodes.yaml") -> dict:
-    cfg_path = Path(path)
-    with cfg_path.open() as f:
-        data = yaml.safe_load(f)
+    # cache JSON do YAML: sem importar/interpretar o PyYAML a cada arranque
+    data = load_yaml_cached(path)
     return data["nodes"]
 
 
@@ -37,6 +39,8 @@ def measure_udp_throughput(node_id: str,
     peer_info = nodes[peer_id]
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # origem = IP deste node (para os filtros tc das regras 'link')
+    sock.bind((nodes[node_id]["ip"], 0))
     sock.settimeout(timeout)
 
     payload = b"x" * payload_size
@@ -80,18 +84,36 @@ def main():
                         help="Tamanho do payload UDP (bytes)")
     parser.add_argument("--interval", type=float, default=3.0,
                         help="Intervalo entre medições consecutivas (s)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Se definido, expõe métricas internas em :PORT/metrics")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Intervalo adaptativo (burst em perda/variância/cenário, backoff se estável)")
+    parser.add_argument("--min-interval", type=float, default=1.0,
+                        help="Com --adaptive: intervalo mínimo (s)")
+    parser.add_argument("--max-interval", type=float, default=30.0,
+                        help="Com --adaptive: intervalo máximo (s)")
+    parser.add_argument("--metric-budget", type=float, default=None,
+                        help="Máximo de métricas/s enviadas por este processo")
     args = parser.parse_args()
 
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
     metrics_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    loop = AdaptiveLoop(metrics_sock, args.interval, adaptive=args.adaptive,
+                        min_interval=args.min_interval, max_interval=args.max_interval,
+                        metric_budget=args.metric_budget,
+                        series=[args.peer_id], label_prefix=f"{args.node_id}->")
 
     while True:
-        t_kbps = measure_udp_throughput(
-            node_id=args.node_id,
-            peer_id=args.peer_id,
-            nodes_cfg_path=args.nodes_cfg,
-            duration=args.duration,
-            payload_size=args.payload_size,
-        )
+        with MEASURE_SECONDS.time():
+            t_kbps = measure_udp_throughput(
+                node_id=args.node_id,
+                peer_id=args.peer_id,
+                nodes_cfg_path=args.nodes_cfg,
+                duration=args.duration,
+                payload_size=args.payload_size,
+            )
 
         send_metric(
             metrics_sock,
@@ -105,7 +127,8 @@ def main():
 
         print(f"[THROUGHPUT] {args.node_id}->{args.peer_id} = {t_kbps:.2f} kbps")
 
-        time.sleep(args.interval)
+        # 0 kbps = nenhum pacote voltou: conta como perda
+        time.sleep(loop.tick(t_kbps or None, series=args.peer_id))
 
 
 if __name__ == "__main__":
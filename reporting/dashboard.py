@@ -1,8 +1,18 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
 from pathlib import Path
 import json
+import math
 import time
 
+from common.logfiles import iter_log_lines, recent_log_files
+from common.moments import summary_moments
+from common.selfmetrics import REGISTRY
+
+SCAN_SECONDS = REGISTRY.histogram(
+    "dashboard_scan_seconds", "Tempo a ler o metrics.log em load_recent_metrics")
+SCAN_LINES = REGISTRY.gauge(
+    "dashboard_scan_lines", "Linhas lidas no último scan do metrics.log")
+
 LOG_DIR = Path("logs")
 LOG_FILE = LOG_DIR / "metrics.log"
 
@@ -12,47 +22,83 @@ app = Flask(__name__, template_folder="templates")
 def load_recent_metrics(metric_name: str = "rtt_ms",
                         window_seconds: float = 10.0):
     """
-    Lê o metrics.log e devolve apenas as métricas do tipo 'metric_name'
+    Lê o metrics.log (e os segmentos rodados há menos de N segundos, mesmo
+    comprimidos) e devolve apenas as métricas do tipo 'metric_name'
     dos últimos N segundos.
     """
     now = time.time()
     cutoff = now - window_seconds
     points = []
 
-    if not LOG_FILE.exists():
-        return points
+    files = recent_log_files(LOG_FILE.parent, LOG_FILE, cutoff)
+
+    scan_start = time.perf_counter()
+    n_lines = 0
+    for line in iter_log_lines(files, since=cutoff):
+        n_lines += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            msg = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+
+        if msg.get("metric") != metric_name:
+            continue
+
+        if msg.get("type") == "summary":
+            # resumo de 1s de um node_collector: um ponto com a média do segundo
+            moments = summary_moments(msg)
+            value = moments[1] if moments is not None else None
+        else:
+            value = msg.get("value")
+        if value is None:
+            continue
+
+        # corrected_timestamp: timestamp do node alinhado ao relógio do collector
+        ts = (msg.get("corrected_timestamp")
+              or msg.get("timestamp")
+              or msg.get("recv_timestamp"))
+        if ts is None or ts < cutoff:
+            continue
+
+        points.append(
+            {
+                "nodeId": msg.get("nodeId"),
+                "peerId": msg.get("peerId"),
+                "value": float(value),
+                "timestamp": ts,
+            }
+        )
+
+    SCAN_SECONDS.observe(time.perf_counter() - scan_start)
+    SCAN_LINES.set(n_lines)
+    return points
 
-    with LOG_FILE.open() as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                msg = json.loads(line)
-            except json.JSONDecodeError:
-                continue
 
-            if msg.get("metric") != metric_name:
-                continue
+def load_recent_events(window_seconds: float = 300.0, limit: int = 50):
+    """
+    Eventos do detetor online (slo_breach / slo_recovered / anomaly) escritos
+    pelo collector no metrics.log, dos últimos N segundos (mais recentes primeiro).
+    """
+    cutoff = time.time() - window_seconds
+    events = []
 
-            value = msg.get("value")
-            if value is None:
-                continue
-
-            ts = msg.get("timestamp") or msg.get("recv_timestamp")
-            if ts is None or ts < cutoff:
-                continue
-
-            points.append(
-                {
-                    "nodeId": msg.get("nodeId"),
-                    "peerId": msg.get("peerId"),
-                    "value": float(value),
-                    "timestamp": ts,
-                }
-            )
+    files = recent_log_files(LOG_FILE.parent, LOG_FILE, cutoff)
+    for line in iter_log_lines(files, since=cutoff):
+        # filtro barato antes do json.loads: só as linhas de eventos
+        if '"event"' not in line:
+            continue
+        try:
+            msg = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if msg.get("timestamp", 0) >= cutoff:
+            events.append(msg)
 
-    return points
+    events.reverse()
+    return events[:limit]
 
 
 @app.route("/")
@@ -68,6 +114,23 @@ def api_latest():
     return jsonify(data)
 
 
+@app.route("/api/events")
+def api_events():
+    try:
+        window = float(request.args.get("window", 300.0))
+    except ValueError:
+        window = None
+    if window is None or not math.isfinite(window) or window <= 0:
+        return jsonify({"error": "window must be a positive number of seconds"}), 400
+    return jsonify(load_recent_events(window_seconds=window))
+
+
+@app.route("/metrics")
+def metrics():
+    # métricas internas do próprio dashboard (formato Prometheus)
+    return Response(REGISTRY.render(), mimetype="text/plain")
+
+
 if __name__ == "__main__":
     # Ex: python3 -m reporting.dashboard
     app.run(host="0.0.0.0", port=8000, debug=True)
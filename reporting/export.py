@@ -0,0 +1,335 @@
+"""
+Exportação de um run (logs/metrics*.log[.gz]) para Parquet ou Arrow IPC,
+para análise offline em pandas / DuckDB / polars sem reescrever o parser.
+
+Estrutura de saída (partições estilo Hive):
+  <out>/metric=rtt_ms/scenario=delay_lo_100ms/part-0.parquet
+  <out>/metric=rtt_ms/scenario=none/part-0.parquet     (fora de qualquer cenário)
+  <out>/_markers.parquet   início/fim de cada cenário (campaign runner)
+  <out>/_events.parquet    eventos do detetor (slo_breach, slo_recovered, anomaly)
+  <out>/_summaries.parquet resumos por segundo dos node_collectors (multi-host):
+                           uma linha por (série, segundo) com count/lost, min/max,
+                           média/M2/desvio e o sketch de quantis (JSON)
+  <out>/_scenarios.json    definição dos cenários (scenarios.yaml)
+
+Cada ficheiro de uma partição leva nos metadados do schema a definição do
+seu cenário ("scenario_def", JSON). Os logs são lidos linha a linha e as linhas
+ficam em buffer até 'batch_rows' no total, por isso a memória não depende
+do tamanho do run.
+
+Precisa de pyarrow (pip install pyarrow).
+"""
+
+import argparse
+import json
+import math
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import quote
+
+from common.config_cache import load_yaml_cached
+from common.logfiles import iter_log_lines
+from common.moments import summary_moments
+from .reporting import LOG_FILE, expand_log_args
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dependência opcional
+    pa = None
+    pq = None
+
+BATCH_ROWS = 256 * 1024
+NO_SCENARIO = "none"
+
+
+def _ts_type():
+    return pa.timestamp("us", tz="UTC")
+
+
+def _metric_schema():
+    return pa.schema([
+        ("nodeId", pa.string()),
+        ("peerId", pa.string()),
+        ("value", pa.float64()),
+        ("lost", pa.bool_()),
+        ("timestamp", _ts_type()),
+        ("recv_timestamp", _ts_type()),
+        ("corrected_timestamp", _ts_type()),
+    ])
+
+
+def _marker_schema():
+    return pa.schema([
+        ("scenario", pa.string()),
+        ("phase", pa.string()),
+        ("timestamp", _ts_type()),
+        ("recv_timestamp", _ts_type()),
+    ])
+
+
+def _event_schema():
+    return pa.schema([
+        ("event", pa.string()),
+        ("nodeId", pa.string()),
+        ("peerId", pa.string()),
+        ("series_metric", pa.string()),
+        ("scenario", pa.string()),
+        ("timestamp", _ts_type()),
+        # restantes campos do evento (rule, observed, threshold, ...), em JSON
+        ("detail", pa.string()),
+    ])
+
+
+def _summary_schema():
+    return pa.schema([
+        ("nodeId", pa.string()),
+        ("peerId", pa.string()),
+        ("metric", pa.string()),
+        ("scenario", pa.string()),
+        ("second", pa.int64()),
+        ("count", pa.int64()),
+        ("lost", pa.int64()),
+        ("min", pa.float64()),
+        ("max", pa.float64()),
+        ("mean", pa.float64()),
+        ("m2", pa.float64()),
+        ("std", pa.float64()),
+        ("sketch", pa.string()),
+        ("timestamp", _ts_type()),
+        ("recv_timestamp", _ts_type()),
+        ("corrected_timestamp", _ts_type()),
+    ])
+
+
+def _us(ts) -> Optional[int]:
+    """Epoch em segundos (float) -> microssegundos, para colunas timestamp[us]."""
+    if isinstance(ts, (int, float)):
+        return int(ts * 1_000_000)
+    return None
+
+
+def _str(v) -> Optional[str]:
+    return None if v is None else str(v)
+
+
+def load_scenario_defs(path: str) -> Dict[str, dict]:
+    cfg_path = Path(path)
+    if not cfg_path.exists():
+        print(f"[EXPORT] {path} not found: exporting without scenario metadata.")
+        return {}
+    data = load_yaml_cached(cfg_path) or {}
+    return data.get("scenarios", {}) or {}
+
+
+class _TableWriter:
+    """Um ficheiro de saída (Parquet ou Arrow IPC) com colunas em buffer."""
+
+    def __init__(self, path: Path, schema, fmt: str):
+        self.path = path
+        self.schema = schema
+        self.fmt = fmt
+        self.columns = {name: [] for name in schema.names}
+        self.rows = 0
+        self._writer = None
+        self._sink = None
+
+    def append(self, row: dict) -> None:
+        for name, col in self.columns.items():
+            col.append(row.get(name))
+        self.rows += 1
+
+    def flush(self) -> None:
+        if self.rows == 0:
+            return
+        table = pa.Table.from_pydict(self.columns, schema=self.schema)
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.fmt == "parquet":
+                self._writer = pq.ParquetWriter(str(self.path), self.schema, compression="zstd")
+            else:
+                self._sink = pa.OSFile(str(self.path), "wb")
+                self._writer = pa.ipc.new_file(self._sink, self.schema)
+        self._writer.write_table(table)
+        self.columns = {name: [] for name in self.schema.names}
+        self.rows = 0
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def export_run(log_files: Iterable,
+               out_dir: str,
+               fmt: str = "parquet",
+               scenarios_cfg: str = "config/scenarios.yaml",
+               batch_rows: int = BATCH_ROWS) -> Dict[str, int]:
+    """
+    Exporta os logs para 'out_dir'. Devolve contagens (metrics, summaries,
+    markers, events, partitions, skipped).
+    """
+    if pa is None:
+        raise SystemExit("[EXPORT] pyarrow is required: pip install pyarrow")
+
+    out = Path(out_dir)
+    if out.exists() and any(out.iterdir()):
+        raise SystemExit(f"[EXPORT] Output directory {out} is not empty.")
+    out.mkdir(parents=True, exist_ok=True)
+
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    scenario_defs = load_scenario_defs(scenarios_cfg)
+    (out / "_scenarios.json").write_text(json.dumps(scenario_defs, indent=2, ensure_ascii=False))
+
+    metric_schema = _metric_schema()
+    partitions: Dict[tuple, _TableWriter] = {}
+    markers = _TableWriter(out / f"_markers.{ext}", _marker_schema(), fmt)
+    events = _TableWriter(out / f"_events.{ext}", _event_schema(), fmt)
+    summaries = _TableWriter(out / f"_summaries.{ext}", _summary_schema(), fmt)
+    counts = {"metrics": 0, "summaries": 0, "markers": 0, "events": 0, "skipped": 0}
+    buffered = 0
+
+    def partition(metric: str, scenario: Optional[str]) -> _TableWriter:
+        key = (metric, scenario)
+        w = partitions.get(key)
+        if w is None:
+            name = scenario if scenario is not None else NO_SCENARIO
+            path = (out / f"metric={quote(metric, safe='')}"
+                    / f"scenario={quote(name, safe='')}" / f"part-0.{ext}")
+            schema = metric_schema.with_metadata({
+                "metric": metric,
+                "scenario": name,
+                "scenario_def": json.dumps(scenario_defs.get(scenario), ensure_ascii=False),
+            })
+            w = partitions[key] = _TableWriter(path, schema, fmt)
+        return w
+
+    for line in iter_log_lines(log_files):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            msg = json.loads(line)
+        except json.JSONDecodeError:
+            counts["skipped"] += 1
+            continue
+        if not isinstance(msg, dict):
+            counts["skipped"] += 1
+            continue
+
+        if msg.get("type") == "marker":
+            markers.append({
+                "scenario": _str(msg.get("scenario")),
+                "phase": _str(msg.get("phase")),
+                "timestamp": _us(msg.get("timestamp")),
+                "recv_timestamp": _us(msg.get("recv_timestamp")),
+            })
+            counts["markers"] += 1
+            writer = markers
+        elif msg.get("type") == "summary":
+            # resumo pré-agregado: não é uma amostra (nem uma perda)
+            moments = summary_moments(msg)
+            n, mean, m2 = moments if moments is not None else (0, None, None)
+            summaries.append({
+                "nodeId": _str(msg.get("nodeId")),
+                "peerId": _str(msg.get("peerId")),
+                "metric": _str(msg.get("metric")),
+                "scenario": _str(msg.get("scenario")),
+                "second": msg.get("second"),
+                "count": msg.get("count"),
+                "lost": msg.get("lost"),
+                "min": msg.get("min"),
+                "max": msg.get("max"),
+                "mean": mean,
+                "m2": m2,
+                "std": math.sqrt(m2 / n) if n > 0 else None,
+                "sketch": json.dumps(msg["sketch"]) if msg.get("sketch") else None,
+                "timestamp": _us(msg.get("timestamp")),
+                "recv_timestamp": _us(msg.get("recv_timestamp")),
+                "corrected_timestamp": _us(msg.get("corrected_timestamp")),
+            })
+            counts["summaries"] += 1
+            writer = summaries
+        elif "event" in msg:
+            detail = {k: v for k, v in msg.items()
+                      if k not in ("event", "nodeId", "peerId", "series_metric",
+                                   "scenario", "timestamp")}
+            events.append({
+                "event": _str(msg.get("event")),
+                "nodeId": _str(msg.get("nodeId")),
+                "peerId": _str(msg.get("peerId")),
+                "series_metric": _str(msg.get("series_metric")),
+                "scenario": _str(msg.get("scenario")),
+                "timestamp": _us(msg.get("timestamp")),
+                "detail": json.dumps(detail),
+            })
+            counts["events"] += 1
+            writer = events
+        elif msg.get("metric"):
+            value = msg.get("value")
+            try:
+                value = None if value is None else float(value)
+            except (TypeError, ValueError):
+                counts["skipped"] += 1
+                continue
+            writer = partition(str(msg["metric"]), msg.get("scenario"))
+            writer.append({
+                "nodeId": _str(msg.get("nodeId")),
+                "peerId": _str(msg.get("peerId")),
+                "value": value,
+                "lost": value is None,
+                "timestamp": _us(msg.get("timestamp")),
+                "recv_timestamp": _us(msg.get("recv_timestamp")),
+                "corrected_timestamp": _us(msg.get("corrected_timestamp")),
+            })
+            counts["metrics"] += 1
+        else:
+            counts["skipped"] += 1
+            continue
+
+        buffered += 1
+        if writer.rows >= batch_rows:
+            buffered -= writer.rows
+            writer.flush()
+        elif buffered >= batch_rows:
+            # limite global: esvaziar a partição com mais linhas em buffer
+            biggest = max([*partitions.values(), markers, events, summaries],
+                          key=lambda w: w.rows)
+            buffered -= biggest.rows
+            biggest.flush()
+
+    for w in [*partitions.values(), markers, events, summaries]:
+        w.close()
+
+    counts["partitions"] = len(partitions)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", nargs="+", default=[str(LOG_FILE)],
+                        help="Ficheiros/globs de log a exportar (.log ou .log.gz)")
+    parser.add_argument("--out", required=True,
+                        help="Diretório de saída (tem de estar vazio ou não existir)")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--scenarios-cfg", default="config/scenarios.yaml")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS,
+                        help="Máximo de linhas em memória antes de escrever")
+    args = parser.parse_args()
+
+    counts = export_run(
+        expand_log_args(args.log),
+        args.out,
+        fmt=args.format,
+        scenarios_cfg=args.scenarios_cfg,
+        batch_rows=args.batch_rows,
+    )
+    print(f"[EXPORT] {counts['metrics']} metrics in {counts['partitions']} partitions, "
+          f"{counts['summaries']} summaries, {counts['markers']} markers, {counts['events']} events "
+          f"({counts['skipped']} lines skipped) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Motor alternativo (NumPy) para as estatísticas do reporting.
+
+Devolve exatamente a mesma estrutura que reporting.build_stats:
+  stats[metric_name][(nodeId, peerId)] = {total, ok, lost, loss_pct, min, max, avg, std}
+com, adicionalmente, p50/p95/p99 (sketch com erro relativo de 1%).
+
+Os logs são lidos em blocos de tamanho fixo (memória limitada, independente
+do tamanho do run). Em cada bloco:
+  - uma regex compilada extrai (série, valor) das linhas no formato do
+    send_metric, sem json.loads por linha;
+  - as séries viram códigos inteiros (dict) e a agregação é feita com
+    bincount / sort + reduceat;
+  - os parciais de cada bloco juntam-se aos acumulados (média/M2 de Chan).
+Blocos com linhas noutro formato (ordem de chaves diferente, nodeId null,
+resumos por segundo dos node_collectors, ...) são processados linha a linha
+com json, para o resultado ser sempre igual.
+
+Pré-passagem colunar: a interpretação das linhas é a parte cara, por isso o
+resultado de cada bloco (códigos int32, valores float64, séries e resumos)
+fica guardado em <dir>/.cache/<ficheiro>.cols.npz, com o mtime e o tamanho
+do log (como em common.config_cache). Nas leituras seguintes do mesmo
+ficheiro só se carregam as colunas e se agrega. O metrics.log atual (ainda a
+crescer) nunca é guardado; os segmentos fechados são.
+
+A frio (sem cache) o ganho face ao build_stats fica em ~4x (1M registos:
+6.6s -> 1.5s), limitado pela regex e pela conversão dos valores; só as
+leituras com cache passam dos 10x (0.08s).
+"""
+
+import gzip
+import json
+import math
+import os
+import re
+import zipfile
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+
+from common.logfiles import columns_cache_path
+from common.moments import summary_moments
+from common.sketch import LogSketch, MIN_ABS_VALUE
+
+CHUNK_BYTES = 64 * 1024 * 1024
+CACHE_VERSION = 1
+# segmento atual do collector: está sempre a mudar, não vale a pena guardar
+ACTIVE_LOG_NAME = "metrics.log"
+
+# linha típica: {"nodeId": "N1", "peerId": "N2", "metric": "rtt_ms", "value": 0.13, ...}
+# grupo 1 = texto da série (nodeId .. metric), grupo 2 = valor
+FAST_RE = re.compile(
+    rb'"nodeId": "((?:[^"\\]*)", "peerId": "(?:[^"\\]*)", "metric": "(?:[^"\\]+))", '
+    rb'"value": (null|-?[0-9][0-9.eE+-]*)[,}]'
+)
+_PEER_SEP = b'", "peerId": "'
+_METRIC_SEP = b'", "metric": "'
+
+SeriesKey = Tuple[str, object, object]
+
+
+class _SeriesAcc:
+    __slots__ = ("total", "lost", "ok", "mean", "m2", "min", "max", "sketch")
+
+    def __init__(self):
+        self.total = 0
+        self.lost = 0
+        self.ok = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = LogSketch()
+
+    def merge(self, total, lost, ok, mean, m2, vmin, vmax) -> None:
+        self.total += total
+        self.lost += lost
+        if ok == 0:
+            return
+        # junção de (n, média, M2) de dois conjuntos (Chan et al.)
+        n = self.ok + ok
+        delta = mean - self.mean
+        self.mean += delta * ok / n
+        self.m2 += m2 + delta * delta * self.ok * ok / n
+        self.ok = n
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+
+def _iter_chunks(path: Path, chunk_bytes: int) -> Iterator[bytes]:
+    """Blocos de ~chunk_bytes, sempre terminados numa linha completa."""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            if not chunk.endswith(b"\n"):
+                chunk += f.readline()
+            yield chunk
+
+
+def _decode_series(raw: bytes) -> SeriesKey:
+    node, rest = raw.split(_PEER_SEP, 1)
+    peer, metric = rest.split(_METRIC_SEP, 1)
+    # as strings vêm escapadas em JSON; sem '\\' (garantido pela regex) são literais
+    return metric.decode(), node.decode(), peer.decode()
+
+
+def _slow_rows(chunk: bytes):
+    """Mesma semântica do build_stats, linha a linha (para blocos fora do formato)."""
+    keys, values, summaries = [], [], []
+    for line in chunk.split(b"\n"):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            m = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(m, dict):
+            continue
+        metric_name = m.get("metric")
+        if not metric_name:
+            continue
+        if m.get("type") == "summary":
+            summaries.append(m)
+            continue
+        v = m.get("value")
+        keys.append((metric_name, m.get("nodeId"), m.get("peerId")))
+        values.append(math.nan if v is None else float(v))
+    return keys, np.array(values, dtype=np.float64), summaries
+
+
+def _merge_summaries(summaries, acc: Dict[SeriesKey, _SeriesAcc], with_quantiles: bool) -> None:
+    for m in summaries:
+        key = (m["metric"], m.get("nodeId"), m.get("peerId"))
+        a = acc.get(key)
+        if a is None:
+            a = acc[key] = _SeriesAcc()
+        moments = summary_moments(m)
+        if moments is not None:
+            ok, mean, m2 = moments
+            a.merge(m["count"], m["lost"], ok, mean, m2, m["min"], m["max"])
+        else:
+            a.merge(m["count"], m["lost"], 0, 0.0, 0.0, math.inf, -math.inf)
+        if with_quantiles and m.get("sketch"):
+            a.sketch.merge(LogSketch.from_dict(m["sketch"]))
+
+
+def _fast_rows(chunk: bytes):
+    """(códigos de série, valores com NaN=perda, lista de séries) ou None se não der."""
+    matches = FAST_RE.findall(chunk)
+    if len(matches) != chunk.count(b'"metric"'):
+        return None
+    if not matches:
+        return np.empty(0, dtype=np.int64), np.empty(0), []
+
+    raw_keys = list(map(itemgetter(0), matches))
+    raw_vals = list(map(itemgetter(1), matches))
+    # nº de séries é pequeno: um dict é mais rápido do que np.unique sobre strings
+    # (dict.fromkeys e map correm em C, sem código Python por linha)
+    index = {k: i for i, k in enumerate(dict.fromkeys(raw_keys))}
+    codes = np.fromiter(map(index.__getitem__, raw_keys),
+                        dtype=np.int64, count=len(raw_keys))
+    vals = np.array(raw_vals)
+    vals[vals == b"null"] = b"nan"
+    values = vals.astype(np.float64)
+    series = [_decode_series(k) for k in index]
+    return codes, values, series
+
+
+def _aggregate_chunk(codes, values, series, acc: Dict[SeriesKey, _SeriesAcc],
+                     with_quantiles: bool) -> None:
+    k = len(series)
+    if k == 0:
+        return
+
+    lost_mask = np.isnan(values)
+    total = np.bincount(codes, minlength=k)
+    lost = np.bincount(codes[lost_mask], minlength=k)
+
+    ok_codes = codes[~lost_mask]
+    ok_vals = values[~lost_mask]
+    ok = np.bincount(ok_codes, minlength=k)
+    sums = np.bincount(ok_codes, weights=ok_vals, minlength=k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(ok > 0, sums / np.maximum(ok, 1), 0.0)
+    m2 = np.bincount(ok_codes, weights=(ok_vals - means[ok_codes]) ** 2, minlength=k)
+
+    # min/max por grupo: ordenar pelo código e reduzir em cada fatia
+    mins = np.full(k, math.inf)
+    maxs = np.full(k, -math.inf)
+    if ok_vals.size:
+        # com menos de 65536 séries, códigos em uint16 -> argsort estável é radix sort
+        sort_codes = ok_codes.astype(np.uint16) if k < 65536 else ok_codes
+        order = np.argsort(sort_codes, kind="stable")
+        sorted_codes = ok_codes[order]
+        sorted_vals = ok_vals[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        present = sorted_codes[starts]
+        mins[present] = np.minimum.reduceat(sorted_vals, starts)
+        maxs[present] = np.maximum.reduceat(sorted_vals, starts)
+
+    for i, key in enumerate(series):
+        a = acc.get(key)
+        if a is None:
+            a = acc[key] = _SeriesAcc()
+        a.merge(int(total[i]), int(lost[i]), int(ok[i]),
+                float(means[i]), float(m2[i]), float(mins[i]), float(maxs[i]))
+
+    if with_quantiles and ok_vals.size:
+        _sketch_chunk(ok_codes, ok_vals, series, acc)
+
+
+def _sketch_chunk(ok_codes, ok_vals, series, acc) -> None:
+    """Índices dos buckets do sketch calculados em bloco; contagens via bincount."""
+    log_gamma = LogSketch().log_gamma
+    absv = np.abs(ok_vals)
+    is_zero = absv < MIN_ABS_VALUE
+
+    zero_counts = np.bincount(ok_codes[is_zero], minlength=len(series))
+    for i in np.flatnonzero(zero_counts):
+        acc[series[i]].sketch.add_zero(int(zero_counts[i]))
+
+    for negative in (False, True):
+        sel = ~is_zero & ((ok_vals < 0) if negative else (ok_vals > 0))
+        if not sel.any():
+            continue
+        bucket = np.ceil(np.log(absv[sel]) / log_gamma).astype(np.int64)
+        # (série, bucket) num só inteiro: bincount em vez de np.unique(axis=0)
+        low = int(bucket.min())
+        span = int(bucket.max()) - low + 1
+        counts = np.bincount(ok_codes[sel] * span + (bucket - low),
+                             minlength=len(series) * span)
+        for flat in np.flatnonzero(counts).tolist():
+            code, b = divmod(flat, span)
+            acc[series[code]].sketch.add_bucket(b + low, int(counts[flat]), negative=negative)
+
+
+def _stamp(path: Path) -> list:
+    st = path.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _parse_chunk(chunk: bytes):
+    """(códigos, valores, séries, resumos) de um bloco, pelo caminho rápido se der."""
+    rows = _fast_rows(chunk)
+    if rows is not None:
+        codes, values, series = rows
+        return codes, values, series, []
+    keys, values, summaries = _slow_rows(chunk)
+    series = list(dict.fromkeys(keys))
+    index = {key: i for i, key in enumerate(series)}
+    codes = np.fromiter(map(index.__getitem__, keys), dtype=np.int64, count=len(keys))
+    return codes, values, series, summaries
+
+
+def _open_cached(path: Path):
+    """(npz, meta) da pré-passagem, se existir e o log não tiver mudado desde então."""
+    try:
+        npz = np.load(columns_cache_path(path))
+    except (OSError, ValueError):
+        return None
+    try:
+        meta = json.loads(npz["meta"].tobytes())
+    except (KeyError, ValueError):
+        meta = None
+    if meta is None or meta.get("version") != CACHE_VERSION or meta.get("stamp") != _stamp(path):
+        npz.close()
+        return None
+    return npz, meta
+
+
+class _CacheWriter:
+    """Escreve o .cols.npz bloco a bloco (zip sem compressão), sem juntar tudo em memória."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.stamp = _stamp(path)
+        self.cache = columns_cache_path(path)
+        self.cache.parent.mkdir(exist_ok=True)
+        self.tmp = self.cache.with_name(f"{self.cache.name}.{os.getpid()}.tmp")
+        self.zf = zipfile.ZipFile(self.tmp, "w", zipfile.ZIP_STORED, allowZip64=True)
+        self.chunks = []
+
+    def _write(self, name: str, array: np.ndarray) -> None:
+        with self.zf.open(name + ".npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.ascontiguousarray(array))
+
+    def add(self, codes, values, series, summaries) -> None:
+        i = len(self.chunks)
+        self._write(f"codes_{i}", codes.astype(np.int32))
+        self._write(f"values_{i}", values)
+        self.chunks.append({"series": series, "summaries": summaries})
+
+    def commit(self) -> None:
+        meta = {"version": CACHE_VERSION, "stamp": self.stamp, "chunks": self.chunks}
+        self._write("meta", np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8))
+        self.zf.close()
+        # o log mudou enquanto era lido: a cache não corresponde a nenhuma versão
+        if _stamp(self.path) != self.stamp:
+            self.tmp.unlink()
+            return
+        self.tmp.replace(self.cache)
+
+    def abort(self) -> None:
+        self.zf.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+def _iter_columns(path: Path, chunk_bytes: int, use_cache: bool):
+    """Blocos (códigos, valores, séries, resumos) de um ficheiro, da cache ou do log."""
+    if use_cache and path.name != ACTIVE_LOG_NAME:
+        cached = _open_cached(path)
+        if cached is not None:
+            npz, meta = cached
+            with npz:
+                # um bloco de cada vez (o NpzFile lê cada array só quando é pedido)
+                for i, chunk in enumerate(meta["chunks"]):
+                    yield (npz[f"codes_{i}"].astype(np.int64), npz[f"values_{i}"],
+                           [tuple(key) for key in chunk["series"]], chunk["summaries"])
+            return
+        try:
+            writer = _CacheWriter(path)
+        except OSError:
+            writer = None
+    else:
+        writer = None
+
+    try:
+        for chunk in _iter_chunks(path, chunk_bytes):
+            columns = _parse_chunk(chunk)
+            if writer is not None:
+                writer.add(*columns)
+            yield columns
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        try:
+            writer.commit()
+        except OSError:
+            writer.abort()
+
+
+def build_stats_fast(log_files: Iterable, chunk_bytes: int = CHUNK_BYTES,
+                     with_quantiles: bool = True, use_cache: bool = True):
+    """
+    Equivalente a build_stats(load_metrics(log_files)), com memória limitada.
+    Com use_cache, lê/escreve a pré-passagem colunar descrita acima.
+    """
+    acc: Dict[SeriesKey, _SeriesAcc] = {}
+
+    for path in log_files:
+        path = Path(path)
+        if not path.exists():
+            print(f"[REPORT] Log file {path} not found.")
+            continue
+        for codes, values, series, summaries in _iter_columns(path, chunk_bytes, use_cache):
+            _merge_summaries(summaries, acc, with_quantiles)
+            _aggregate_chunk(codes, values, series, acc, with_quantiles)
+
+    stats = {}
+    for (metric_name, node, peer), a in acc.items():
+        if a.ok > 0:
+            min_v, max_v, avg_v = a.min, a.max, a.mean
+            std_v = math.sqrt(a.m2 / a.ok) if a.ok > 1 else 0.0
+        else:
+            min_v = max_v = avg_v = std_v = None
+
+        s = {
+            "total": a.total,
+            "ok": a.ok,
+            "lost": a.lost,
+            "loss_pct": (a.lost / a.total * 100.0) if a.total > 0 else 0.0,
+            "min": min_v,
+            "max": max_v,
+            "avg": avg_v,
+            "std": std_v,
+        }
+        if with_quantiles:
+            for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+                s[name] = a.sketch.quantile(q)
+        stats.setdefault(metric_name, {})[(node, peer)] = s
+
+    return stats
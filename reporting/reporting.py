@@ -1,29 +1,60 @@
+import argparse
+import glob
 import json
 from pathlib import Path
 from statistics import mean, pstdev
 
+from common.logfiles import iter_log_lines, log_sort_key
+from common.moments import Moments, summary_moments
+
 LOG_FILE = Path("logs/metrics.log")
 
 
-def load_metrics():
+def load_metrics(log_file=None):
+    """
+    Lê um ou vários ficheiros de log (texto ou segmentos .gz rodados pelo
+    collector). 'log_file' pode ser um caminho ou uma lista de caminhos.
+    """
+    if log_file is None:
+        log_files = [LOG_FILE]
+    elif isinstance(log_file, (list, tuple)):
+        log_files = [Path(p) for p in log_file]
+    else:
+        log_files = [Path(log_file)]
+
     metrics = []
-    if not LOG_FILE.exists():
-        print(f"[REPORT] Log file {LOG_FILE} not found.")
-        return metrics
-
-    with LOG_FILE.open() as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-            metrics.append(obj)
+    for path in log_files:
+        if not path.exists():
+            print(f"[REPORT] Log file {path} not found.")
+
+    for line in iter_log_lines(log_files):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        metrics.append(obj)
     return metrics
 
 
+def expand_log_args(patterns):
+    """
+    Expande globs (ex: 'logs/metrics-2025*.log.gz') mantendo a ordem pedida;
+    os ficheiros de cada glob ficam por ordem cronológica (log_sort_key).
+    """
+    files = []
+    for pattern in patterns:
+        # só segmentos de log (não os índices .idx nem temporários)
+        matches = sorted(
+            (p for p in glob.glob(pattern) if p.endswith(".log") or p.endswith(".gz")),
+            key=log_sort_key,
+        )
+        files.extend(matches if matches else [pattern])
+    return files
+
+
 def build_stats(metrics):
     """
     Agrupa por metricName e (nodeId, peerId) e calcula:
@@ -32,6 +63,8 @@ def build_stats(metrics):
       - nº perdidos (value == None)
       - perda %
       - min / max / média / stddev do value
+    As linhas "summary" (resumos por segundo dos node_collectors) entram com
+    as suas contagens, média/M2 e min/max.
     Devolve:
       stats[metric_name][(nodeId, peerId)] = {...}
     """
@@ -54,9 +87,25 @@ def build_stats(metrics):
                 "values": [],
                 "lost": 0,
                 "total": 0,
+                # agregados vindos de resumos: [Moments, min, max]
+                "summary": None,
             }
 
         g = groups[metric_name][key]
+
+        if m.get("type") == "summary":
+            g["total"] += m["count"]
+            g["lost"] += m["lost"]
+            moments = summary_moments(m)
+            if moments is not None:
+                if g["summary"] is None:
+                    g["summary"] = [Moments(), m["min"], m["max"]]
+                s = g["summary"]
+                s[0].merge(*moments)
+                s[1] = min(s[1], m["min"])
+                s[2] = max(s[2], m["max"])
+            continue
+
         g["total"] += 1
 
         v = m.get("value")
@@ -74,8 +123,19 @@ def build_stats(metrics):
             total = g["total"]
             lost = g["lost"]
             ok = len(vals)
+            s = g["summary"]
 
-            if ok > 0:
+            if s is not None:
+                # com resumos: juntar as amostras soltas aos momentos dos resumos
+                moments = s[0]
+                for v in vals:
+                    moments.add(v)
+                ok = moments.n
+                min_v = min([s[1], *vals])
+                max_v = max([s[2], *vals])
+                avg_v = moments.mean
+                std_v = moments.std()
+            elif ok > 0:
                 min_v = min(vals)
                 max_v = max(vals)
                 avg_v = mean(vals)
@@ -99,6 +159,16 @@ def build_stats(metrics):
     return stats
 
 
+def _print_quantiles(metric_name, stats_for_metric):
+    print(f"\n--- Quantis (sketch, erro relativo 1%): {metric_name} ---")
+    print("From   To      p50     p95     p99")
+    for (node, peer), s in sorted(stats_for_metric.items()):
+        def fmt(x):
+            return f"{x:7.2f}" if isinstance(x, (float, int)) else "   n/a "
+
+        print(f"{node:5} {peer:5} {fmt(s.get('p50'))} {fmt(s.get('p95'))} {fmt(s.get('p99'))}")
+
+
 def _print_one_metric(metric_name, stats_for_metric):
     print(f"\n=== Stats para métrica: {metric_name} (nodeId -> peerId) ===")
     print("From   To   Total  OK   Lost  Loss%   Min     Max     Avg     Std")
@@ -117,9 +187,71 @@ def _print_one_metric(metric_name, stats_for_metric):
         print(line)
 
 
+def print_comparison(stats_by_scenario, scenario_order=None):
+    """
+    Tabela comparativa: para cada métrica, uma linha por (cenário, nodeId, peerId).
+    'scenario_order' permite manter a ordem em que a campanha correu.
+    """
+    scenarios = scenario_order or sorted(stats_by_scenario.keys())
+    metric_names = sorted({
+        metric_name
+        for sc in scenarios
+        for metric_name in stats_by_scenario.get(sc, {})
+    })
+
+    def fmt(x):
+        return f"{x:7.2f}" if isinstance(x, (float, int)) else "   n/a "
+
+    for metric_name in metric_names:
+        print(f"\n=== Comparação de cenários para métrica: {metric_name} ===")
+        print("Scenario                        From   To   Total  OK   Lost  Loss%   Min     Max     Avg     Std")
+        print("-" * 110)
+        for sc in scenarios:
+            by_link = stats_by_scenario.get(sc, {}).get(metric_name)
+            if not by_link:
+                continue
+            for (node, peer), s in sorted(by_link.items()):
+                print(
+                    f"{sc:30.30} {node:5} {peer:5} "
+                    f"{s['total']:6d} {s['ok']:4d} {s['lost']:5d} "
+                    f"{fmt(s['loss_pct'])} "
+                    f"{fmt(s['min'])} {fmt(s['max'])} {fmt(s['avg'])} {fmt(s['std'])}"
+                )
+
+
 if __name__ == "__main__":
-    metrics = load_metrics()
-    stats = build_stats(metrics)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--log",
+        nargs="+",
+        default=[str(LOG_FILE)],
+        help="Ficheiros/globs de log a ler (.log ou .log.gz), ex: 'logs/metrics-*.log.gz' logs/metrics.log",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["python", "numpy"],
+        default="python",
+        help="numpy: leitura em blocos + agregação vetorizada (runs grandes, precisa de numpy)",
+    )
+    parser.add_argument(
+        "--quantiles",
+        action="store_true",
+        help="Com --engine numpy, mostra também p50/p95/p99",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Com --engine numpy, não ler/escrever a pré-passagem colunar (logs/.cache/*.cols.npz)",
+    )
+    args = parser.parse_args()
+
+    log_files = expand_log_args(args.log)
+    if args.engine == "numpy":
+        from .fast_stats import build_stats_fast
+        stats = build_stats_fast(log_files, with_quantiles=args.quantiles,
+                                 use_cache=not args.no_cache)
+    else:
+        stats = build_stats(load_metrics(log_files))
 
     if not stats:
         print("[REPORT] Sem métricas para apresentar.")
@@ -127,3 +259,5 @@ if __name__ == "__main__":
         # Imprime cada métrica separadamente (ex: rtt_ms, throughput_kbps, app_latency_ms)
         for metric_name in sorted(stats.keys()):
             _print_one_metric(metric_name, stats[metric_name])
+            if args.quantiles and args.engine == "numpy":
+                _print_quantiles(metric_name, stats[metric_name])
@@ -0,0 +1,70 @@
+from collector.detector import StreamDetector
+
+SLO_CFG = "config/slo.yaml"
+
+
+def _run(detector, metric, interval, duration, sweep=1.0, value=1.0, stop_at=None):
+    """Série constante a cada 'interval' s (até 'stop_at'), com varrimentos a cada 'sweep' s."""
+    events = []
+    t = next_sample = 1000.0
+    end = t + duration
+    while t <= end:
+        if t >= next_sample and (stop_at is None or t < 1000.0 + stop_at):
+            events += detector.observe({"metric": metric, "nodeId": "N1",
+                                        "peerId": "N2", "value": value}, t)
+            next_sample += interval
+        events += detector.sweep(t)
+        t += sweep
+    return events
+
+
+def _state(detector, metric):
+    return detector.series[(metric, "N1", "N2")]
+
+
+def test_steady_10s_series_never_breaches():
+    detector = StreamDetector.from_config(SLO_CFG)
+    events = _run(detector, "app_latency_ms", interval=10.0, duration=3600.0, value=20.0)
+    assert events == []
+    assert _state(detector, "app_latency_ms").lost == 0
+
+
+def test_steady_5s_series_has_no_losses():
+    detector = StreamDetector.from_config(SLO_CFG)
+    events = _run(detector, "rtt_ms", interval=5.0, duration=1800.0)
+    assert events == []
+    assert _state(detector, "rtt_ms").lost == 0
+
+
+def test_silent_series_breaches_loss_slo():
+    detector = StreamDetector.from_config(SLO_CFG)
+    events = _run(detector, "rtt_ms", interval=1.0, duration=120.0, stop_at=40.0)
+    breaches = [ev for ev in events if ev["event"] == "slo_breach"]
+    assert breaches and breaches[0]["rule"] == "loss% > 5"
+    # uma perda por intervalo em falta, não por varrimento
+    assert _state(detector, "rtt_ms").lost <= 80
+
+
+def test_non_numeric_value_is_skipped():
+    detector = StreamDetector.from_config(SLO_CFG)
+    assert detector.observe({"metric": "rtt_ms", "nodeId": "N1", "value": "abc"}, 1.0) == []
+    assert detector.observe({"metric": "rtt_ms", "nodeId": "N1", "value": [1]}, 2.0) == []
+    assert detector.series == {}
+
+
+def test_backoff_from_burst_has_no_losses():
+    # probe adaptativo: burst a 0.2s e depois intervalo x1.25 até 10s
+    detector = StreamDetector.from_config(SLO_CFG)
+    events = []
+    t, interval = 1000.0, 0.2
+    next_sweep = t
+    for _ in range(200):
+        events += detector.observe({"metric": "app_latency_ms", "nodeId": "N1",
+                                    "peerId": "N2", "value": 20.0}, t)
+        t += interval
+        while next_sweep < t:
+            events += detector.sweep(next_sweep)
+            next_sweep += 1.0
+        interval = min(10.0, interval * 1.25)
+    assert events == []
+    assert _state(detector, "app_latency_ms").lost == 0
@@ -0,0 +1,47 @@
+import json
+import os
+
+from common.logfiles import apply_retention, columns_cache_path, compress_segment, list_segments
+
+
+def _write_segment(log_dir, name, lines=10):
+    path = log_dir / name
+    path.write_text("".join(
+        json.dumps({"nodeId": "N1", "peerId": "N2", "metric": "rtt_ms",
+                    "value": float(i), "timestamp": 1000.0 + i}) + "\n"
+        for i in range(lines)
+    ))
+    return path
+
+
+def _write_cache(path):
+    cache = columns_cache_path(path)
+    cache.parent.mkdir(exist_ok=True)
+    cache.write_bytes(b"x" * 100)
+    return cache
+
+
+def test_retention_deletes_index_and_columns_cache(tmp_path):
+    names = ["metrics-20250101-000000.log", "metrics-20250101-010000.log",
+             "metrics-20250101-020000.log"]
+    caches = []
+    for name in names:
+        gz = compress_segment(_write_segment(tmp_path, name))
+        caches.append(_write_cache(gz))
+
+    removed = apply_retention(tmp_path, max_segments=1)
+
+    assert [p.name for p in removed] == [n + ".gz" for n in names[:2]]
+    assert [p.name for p in list_segments(tmp_path)] == [names[2] + ".gz"]
+    assert not caches[0].exists() and not caches[1].exists()
+    assert caches[2].exists()
+    # nada órfão: só restam os ficheiros do segmento que ficou
+    assert sorted(os.listdir(tmp_path)) == [".cache", names[2] + ".gz", names[2] + ".gz.idx"]
+    assert os.listdir(tmp_path / ".cache") == [caches[2].name]
+
+
+def test_compress_drops_cache_of_uncompressed_segment(tmp_path):
+    src = _write_segment(tmp_path, "metrics-20250101-000000.log")
+    cache = _write_cache(src)
+    compress_segment(src)
+    assert not cache.exists()